@@ -0,0 +1,90 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Loads images, fonts and sounds on a pool of background threads, so that
+# the window can show the waiting screen while they are decoded.
+#
+# Required assets are all started straight away, and ready says when they
+# are in. Optional assets are only started the first time somebody asks for
+# one, and until it has loaded get returns its placeholder. A finish
+# function, like converting an image to the display's pixel format, is run
+# on the thread that calls get, since SDL wants that done on the main
+# thread.
+
+import concurrent.futures
+
+WORKERS = 4
+
+
+class AssetManager:
+    def __init__(self, workers=WORKERS):
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="assets")
+        self.jobs = {}
+        self.futures = {}
+        self.loaded = {}
+        self.required = []
+
+    def load(self, name, loader, *args, required=True, placeholder=None, finish=None):
+        self.jobs[name] = (loader, args, placeholder, finish)
+        if required:
+            self.required.append(name)
+            self.start(name)
+
+    def start(self, name):
+        if name not in self.futures:
+            loader, args, placeholder, finish = self.jobs[name]
+            self.futures[name] = self.pool.submit(loader, *args)
+
+    def get(self, name, wait=None):
+        # Waits for a required asset unless wait is False, and never waits
+        # for an optional one. Errors from the loader are raised here.
+        if name in self.loaded:
+            return self.loaded[name]
+        if wait is None:
+            wait = name in self.required
+        self.start(name)
+        future = self.futures[name]
+        loader, args, placeholder, finish = self.jobs[name]
+        if not wait and not future.done():
+            return placeholder
+        asset = future.result()
+        if finish is not None:
+            asset = finish(asset)
+        self.loaded[name] = asset
+        return asset
+
+    def progress(self):
+        # How many of the required assets have loaded, and how many there are.
+        done = sum(1 for name in self.required if self.futures[name].done())
+        return done, len(self.required)
+
+    def ready(self):
+        done, count = self.progress()
+        return done == count
+
+    def wait(self):
+        for name in self.required:
+            self.get(name)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
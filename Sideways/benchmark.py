@@ -0,0 +1,283 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Run with "python benchmark.py" for all benchmarks, or give the names of the
+# ones to run. It opens no window unless SDL_VIDEODRIVER says otherwise.
+
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import final
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def measure(label, function, count):
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    print("%-50s %10.0f ns" % (label, seconds / count * 1e9))
+
+
+def overlapping_rects(graphics, name_a, name_b, count):
+    image_a = getattr(graphics, name_a)
+    image_b = getattr(graphics, name_b)
+    pairs = []
+    for i in range(count):
+        rect_b = image_b.get_rect(topleft=(100, 100))
+        x = random.randint(rect_b.left - image_a.get_width() + 1, rect_b.right - 1)
+        y = random.randint(rect_b.top - image_a.get_height() + 1, rect_b.bottom - 1)
+        pairs.append((image_a.get_rect(topleft=(x, y)), rect_b))
+    return pairs
+
+
+@benchmark
+def collisions(graphics):
+    print("Cost per pair of overlapping rects:")
+    for name_a, name_b in [("player_shot", "alien"), ("alien_shot", "player")]:
+        pairs = overlapping_rects(graphics, name_a, name_b, 100000)
+
+        def rects_only():
+            for rect_a, rect_b in pairs:
+                rect_a.colliderect(rect_b)
+
+        def precise():
+            for rect_a, rect_b in pairs:
+                if rect_a.colliderect(rect_b):
+                    final.precise_hit(graphics, name_a, rect_a, name_b, rect_b)
+
+        def swept():
+            for rect_a, rect_b in pairs:
+                final.swept_overlap(rect_a, (8, 0), rect_b, (-2, 0))
+
+        final.PRECISE_COLLISIONS = True
+        measure(name_a + " / " + name_b + " rects only", rects_only, len(pairs))
+        measure(name_a + " / " + name_b + " swept rects", swept, len(pairs))
+        graphics.overlap_cache.clear()
+        measure(name_a + " / " + name_b + " masks, empty cache", precise, len(pairs))
+        measure(name_a + " / " + name_b + " masks, filled cache", precise, len(pairs))
+        print("%-50s %10d" % ("Cached offsets", len(graphics.overlap_cache)))
+        final.PRECISE_COLLISIONS = False
+
+
+def busy_game_state(graphics):
+    random.seed(1)
+    game_area = pygame.Rect(0, 0, 800, 560)
+    game_state = final.GameState(graphics, game_area)
+    game_state.mode = "playing"
+    for i in range(200):
+        position = (random.randint(0, 800), random.randint(0, 560))
+        final.add_entity(game_state.player_shots,
+                         final.PlayerShot(graphics.player_shot.get_rect(center=position)))
+        position = (random.randint(0, 800), random.randint(0, 560))
+        final.add_entity(game_state.alien_shots,
+                         final.AlienShot(graphics.alien_shot.get_rect(center=position), 0, 0))
+    for i in range(10):
+        explosion = final.Explosion((random.randint(0, 800), random.randint(0, 560)),
+                                    100, (255, 200, 0))
+        explosion.current_radius = random.randint(10, 100)
+        game_state.explosions.append(explosion)
+    return game_state
+
+
+@benchmark
+def renderers(graphics):
+    from pygame._sdl2 import video
+    import renderers
+
+    game_state = busy_game_state(graphics)
+    print("Time per frame with %d stars, 400 shots and 10 explosions:" % len(game_state.stars))
+    surface_renderer = renderers.SurfaceRenderer(pygame.display.get_surface(), graphics)
+    texture_window = video.Window("Sideways benchmark", (800, 600))
+    texture_renderer = renderers.TextureRenderer(texture_window, graphics, (800, 600))
+    frames = 300
+    for name, screen in [("surface", surface_renderer), ("texture", texture_renderer)]:
+        for star_min_radius in [0, 1, 2]:
+            graphics.quality.star_min_radius = star_min_radius
+
+            def paint():
+                for i in range(frames):
+                    final.paint_screen(screen, game_state, graphics)
+
+            measure("%s renderer, stars from radius %d" % (name, star_min_radius), paint, frames)
+    texture_window.destroy()
+
+
+@benchmark
+def particle_system(graphics):
+    import particles
+    import renderers
+
+    system = particles.make_particle_system(50000)
+    if system is None:
+        print("Particles need NumPy")
+        return
+    while system.count < system.capacity:
+        system.emit((400, 280), 1000, 300, [(255, 200, 0), (255, 50, 0)], 1000)
+    screen = renderers.SurfaceRenderer(pygame.display.get_surface(), graphics)
+    game_area = pygame.Rect(0, 0, 800, 560)
+    frames = 100
+    print("Time per frame with %d live particles:" % system.count)
+
+    def update():
+        for i in range(frames):
+            system.update(1 / 60)
+
+    def paint():
+        for i in range(frames):
+            screen.enter_game_area(game_area)
+            screen.particles(system.frame())
+            screen.leave_game_area()
+
+    measure("update", update, frames)
+    measure("draw on surface", paint, frames)
+
+
+@benchmark
+def projectile_patterns(graphics):
+    import projectiles
+    import renderers
+
+    system = projectiles.make_projectile_system(20000, graphics.alien_shot.get_size())
+    if system is None:
+        print("Projectiles need NumPy")
+        return
+    game_area = pygame.Rect(0, 0, 800, 560)
+    emitter = projectiles.Emitter("spiral", 50, 1, 1, 0, 0.1)
+    while system.count < system.capacity:
+        speed_x, speed_y = emitter.fire((400, 280), (0, 280))
+        system.spawn((random.randint(0, 800), random.randint(0, 560)), speed_x, speed_y)
+    screen = renderers.SurfaceRenderer(pygame.display.get_surface(), graphics)
+    player_rect = graphics.player.get_rect(center=(400, 280))
+    frames = 100
+    print("Time per frame with %d alien shots:" % system.count)
+
+    def update():
+        for i in range(frames):
+            system.move(1 / 60)
+            system.cull(game_area)
+
+    def hits():
+        for i in range(frames):
+            system.hits(player_rect, (0, 0), 1 / 60)
+
+    def paint():
+        for i in range(frames):
+            screen.enter_game_area(game_area)
+            screen.sprites("alien_shot", *system.positions())
+            screen.leave_game_area()
+
+    measure("update", update, frames)
+    measure("hit test against the player", hits, frames)
+    measure("draw on surface", paint, frames)
+
+
+def heavy_game_state(graphics):
+    import projectiles
+
+    # The player is left out so that nothing ends the wave or the game.
+    game_state = busy_game_state(graphics)
+    game_state.player.alive = False
+    game_state.wave_number = final.PATTERN_WAVE
+    for index, alien in enumerate(game_state.aliens):
+        alien.emitter = projectiles.Emitter(**final.EMITTERS[index % len(final.EMITTERS)])
+    if game_state.projectiles:
+        emitter = projectiles.Emitter("ring", 100, 120, 1, 0)
+        for i in range(50):
+            speed_x, speed_y = emitter.fire((400, 280), (0, 0))
+            game_state.projectiles.spawn((random.randint(300, 500), random.randint(200, 360)),
+                                         speed_x, speed_y)
+    return game_state
+
+
+@benchmark
+def processes(graphics):
+    import simprocess
+
+    if simprocess.numpy is None:
+        print("The simulation process needs NumPy")
+        return
+    import renderers
+
+    screen = renderers.SurfaceRenderer(pygame.display.get_surface(), graphics)
+    player_input = final.PlayerInput()
+    seconds = 3.0
+    print("Unpaced frames per second over %.0f seconds with a heavy wave:" % seconds)
+
+    game_state = heavy_game_state(graphics)
+    frames = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        game_state = final.step_game(game_state, player_input, graphics, 1 / 60)
+        final.paint_screen(screen, game_state, graphics)
+        frames = frames + 1
+    print("%-50s %10.0f" % ("one process, ticks and frames", frames / seconds))
+
+    game_state = heavy_game_state(graphics)
+    simulation = simprocess.SimulationProcess(game_state, final.PROJECTILE_CAPACITY,
+                                              final.PARTICLE_CAPACITY, paced=False)
+    # Waits for the simulation process to get going before measuring.
+    while simulation.frame.newest()[0].header[simprocess.TICK] < 1:
+        time.sleep(0.01)
+    frames = 0
+    torn_frames = 0
+    first_tick = simulation.frame.newest()[0].header[simprocess.TICK]
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        while True:
+            slot, sequence = simulation.frame.newest()
+            final.paint_shared_frame(screen, slot, game_state.game_area, graphics)
+            if simulation.frame.still_valid(slot, sequence):
+                break
+            torn_frames = torn_frames + 1
+        screen.present()
+        frames = frames + 1
+    ticks = simulation.frame.newest()[0].header[simprocess.TICK] - first_tick
+    simulation.stop()
+    print("%-50s %10.0f" % ("two processes, ticks", ticks / seconds))
+    print("%-50s %10.0f" % ("two processes, frames", frames / seconds))
+    print("%-50s %10d" % ("two processes, frames drawn again", torn_frames))
+
+
+def setup():
+    pygame.init()
+    pygame.display.set_mode((800, 600))
+    return final.Graphics()
+
+
+if __name__ == "__main__":
+    graphics = setup()
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name](graphics)
+    pygame.quit()
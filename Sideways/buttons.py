@@ -0,0 +1,58 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# The state of the game's buttons, set from a buffer of entries
+# (time, action, pressed, since). PlayerInput fills the buffer from
+# pygame's events, and in a simulation process RemoteInput fills it from
+# what the drawing process sends.
+
+import collections
+
+
+class Buttons:
+    def __init__(self):
+        self.stop = False
+        self.left = False
+        self.right = False
+        self.up = False
+        self.down = False
+        self.fire = False
+        self.pause = False
+        self.applied = []
+        self.buffer = collections.deque()
+
+    def apply_until(self, seconds):
+        # Applies the buffered input that happened before the given time.
+        # When an action changes a second time in the same step, the rest
+        # is left for the next step so that a quick tap is not lost.
+        self.applied = []
+        changed = set()
+        while self.buffer and self.buffer[0][0] <= seconds:
+            timestamp, action, pressed, since = self.buffer[0]
+            if getattr(self, action) != pressed:
+                if action in changed:
+                    break
+                setattr(self, action, pressed)
+                changed.add(action)
+                self.applied.append((timestamp, action, pressed, since))
+            self.buffer.popleft()
@@ -0,0 +1,221 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Records the frames the game shows. At most frames_per_second times a
+# second, the display surface is copied through surfarray into the next free
+# buffer of a ring made up front, which is all the main thread does. A
+# writer thread turns the buffers into a numbered PNG sequence, or appends
+# them to one raw RGB24 video file, which ffmpeg reads with
+#
+#   ffmpeg -f rawvideo -pix_fmt rgb24 -s 800x600 -r 30 -i capture.rgb out.mp4
+#
+# When the writer has not finished with any of the buffers the frame is
+# dropped and counted, so the game never waits for the disk.
+#
+# Either way the output holds one frame for every period of the recording,
+# so it plays back at a fixed rate. A period in which nothing new was shown,
+# as on an idle screen, or whose frame was dropped, repeats the frame
+# before it.
+#
+# NumPy is optional. Without it make_frame_capture returns None.
+
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import pygame
+
+try:
+    import numpy
+    import pygame.surfarray
+    import pygame.pixelcopy
+except ImportError:
+    numpy = None
+
+RING_SIZE = 8
+# The writer thread runs at a lower priority where the system allows it, so
+# that on a machine with few cores the game comes first.
+WRITER_NICENESS = 10
+# The PNG files are written here with zlib, which lets go of the GIL while
+# it compresses, at its fastest level.
+PNG_COMPRESSION = 1
+FORMATS = ["png", "raw"]
+
+
+def make_frame_capture(path, frames_per_second, surface, file_format):
+    if numpy is None:
+        return None
+    return FrameCapture(path, frames_per_second, surface, file_format)
+
+
+class FrameCapture:
+    def __init__(self, path, frames_per_second, surface, file_format, ring_size=RING_SIZE):
+        if file_format not in FORMATS:
+            raise ValueError("Unknown capture format " + repr(file_format))
+        self.path = path
+        self.period = 1.0 / frames_per_second
+        self.file_format = file_format
+        self.size = surface.get_size()
+        # Four byte pixels are copied as they are, with the shifts kept to
+        # take them apart later. Other surfaces are copied as RGB.
+        self.packed = surface.get_bytesize() == 4
+        self.shifts = surface.get_shifts()[:3]
+        if self.packed:
+            self.ring = [numpy.zeros(self.size, numpy.uint32) for i in range(ring_size)]
+        else:
+            self.ring = [numpy.zeros(self.size + (3,), numpy.uint8) for i in range(ring_size)]
+        self.free = queue.SimpleQueue()
+        for index in range(ring_size):
+            self.free.put(index)
+        self.filled = queue.SimpleQueue()
+        # The last frame the writer encoded, kept by the writer for repeats.
+        self.last_data = None
+        self.next_due = time.perf_counter()
+        # Periods passed since the last buffer was queued, to be filled by
+        # repeating the frame before.
+        self.repeats = 0
+        self.captured = 0
+        self.written = 0
+        self.repeated = 0
+        self.dropped = 0
+        self.error = None
+        if file_format == "png":
+            os.makedirs(path, exist_ok=True)
+            self.file = None
+        else:
+            self.file = open(path, "wb")
+        self.writer = threading.Thread(target=self.write_frames, name="capture", daemon=True)
+        self.writer.start()
+
+    def frame(self, surface):
+        # Called after each frame is shown.
+        now = time.perf_counter()
+        if now < self.next_due:
+            return
+        self.repeats = self.repeats + self.periods_passed(now) - 1
+        try:
+            index = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped = self.dropped + 1
+            self.repeats = self.repeats + 1
+            return
+        if self.packed:
+            pixels = pygame.surfarray.pixels2d(surface)
+            numpy.copyto(self.ring[index], pixels)
+            del pixels
+        else:
+            pygame.pixelcopy.surface_to_array(self.ring[index], surface)
+        self.filled.put((index, self.captured, self.repeats))
+        self.captured = self.captured + self.repeats + 1
+        self.repeats = 0
+
+    def periods_passed(self, now):
+        # The number of periods that have come due by now, moving next_due
+        # past them.
+        if now < self.next_due:
+            return 0
+        passed = int((now - self.next_due) / self.period) + 1
+        self.next_due = self.next_due + passed * self.period
+        return passed
+
+    def rgb(self, buffer):
+        # The buffer as rows of RGB pixels.
+        if not self.packed:
+            return buffer.transpose(1, 0, 2)
+        rows = buffer.T
+        rgb = numpy.empty(rows.shape + (3,), numpy.uint8)
+        for channel, shift in enumerate(self.shifts):
+            rgb[:, :, channel] = rows >> shift
+        return rgb
+
+    def write_frames(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WRITER_NICENESS)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            item = self.filled.get()
+            if item is None:
+                return
+            index, number, repeats = item
+            try:
+                if self.error is None and self.last_data is not None:
+                    for repeat in range(repeats):
+                        self.write_frame(self.last_data, number)
+                        self.repeated = self.repeated + 1
+                        number = number + 1
+                if self.error is None and index is not None:
+                    self.last_data = self.encode(self.rgb(self.ring[index]))
+                    self.write_frame(self.last_data, number)
+                    self.written = self.written + 1
+            except (OSError, pygame.error) as error:
+                # Recording stops, but the game goes on.
+                self.error = error
+            if index is not None:
+                self.free.put(index)
+
+    def encode(self, rgb):
+        if self.file is not None:
+            return rgb.tobytes()
+        return png_bytes(rgb)
+
+    def write_frame(self, data, number):
+        if self.file is not None:
+            self.file.write(data)
+            return
+        with open(os.path.join(self.path, "frame%06d.png" % number), "wb") as png_file:
+            png_file.write(data)
+
+    def close(self):
+        # The periods up to now still hold the last frame shown.
+        repeats = self.repeats + self.periods_passed(time.perf_counter())
+        self.filled.put((None, self.captured, repeats))
+        self.filled.put(None)
+        self.writer.join()
+        if self.file is not None:
+            self.file.close()
+
+    def report(self):
+        report = ("Capture: %d frames written, %d repeated where nothing new was shown, "
+                  "%d dropped because the writer was behind" % (
+                      self.written, self.repeated, self.dropped))
+        if self.error is not None:
+            report = report + ", stopped by " + str(self.error)
+        return report
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def png_bytes(rgb):
+    # An 8 bit RGB PNG of rows of pixels, each row with filter type 0.
+    height, width = rgb.shape[:2]
+    rows = numpy.zeros((height, 1 + width * 3), numpy.uint8)
+    rows[:, 1:] = rgb.reshape(height, width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", header) +
+            png_chunk(b"IDAT", zlib.compress(rows.tobytes(), PNG_COMPRESSION)) +
+            png_chunk(b"IEND", b""))
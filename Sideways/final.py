@@ -23,20 +23,150 @@
 import pygame
 import time
 import random
+import threading
+import logging
+import replay
+import assets
+import buttons
+import governor
+import gccontrol
+import timers
+import latency
+import pacing
+import renderers
+import sounds
+import capture
+import particles
+import projectiles
+import simprocess
 
 FRAMES_PER_SECOND = 60
+REPLAY_FILE = None
+LATENCY_FILE = None
+RENDER_THREAD = False
+# Runs the simulation in a separate process instead of a thread, so the two
+# can use a core each. Needs NumPy.
+SIMULATION_PROCESS = False
+RENDER_FRAMES_PER_SECOND = 144
+VSYNC = False
+# Below 1 the game is drawn on a smaller canvas that is then stretched to
+# fill the window, so drawing costs less than the window's pixel count.
+# SCALED_WINDOW lets SDL stretch the 800x600 window to fill the screen.
+RENDER_SCALE = 1.0
+SCALED_WINDOW = False
+# "surface" blits with pygame surfaces, "texture" draws with SDL's renderer.
+RENDERER = "surface"
+# Set to 0 to turn particles off. They also stay off if NumPy is missing.
+PARTICLE_CAPACITY = 50000
+ALIEN_PARTICLES = 300
+PLAYER_PARTICLES = 800
+ADAPTIVE_QUALITY = True
+ALIEN_SHOTS_PER_SECOND = 0.06
+# From PATTERN_WAVE on every alien fires bursts of shots in one of the
+# EMITTERS patterns instead of single shots. Set PROJECTILE_CAPACITY to 0 to
+# turn the patterns off. They also stay off if NumPy is missing.
+PATTERN_WAVE = 6
+PATTERN_BURSTS_PER_SECOND = 0.15
+PROJECTILE_CAPACITY = 20000
+EMITTERS = [
+    {"pattern": "ring", "count": 24, "speed": 150, "volleys": 3,
+     "volley_seconds": 0.25, "turn": 0.13},
+    {"pattern": "spiral", "count": 4, "speed": 180, "volleys": 40,
+     "volley_seconds": 0.05, "turn": 0.25},
+    {"pattern": "fan", "count": 7, "speed": 250, "volleys": 3,
+     "volley_seconds": 0.3, "spread": 0.8},
+]
+GAME_SPEED = 1.0
+PRECISE_COLLISIONS = False
+# Freezes the objects made at startup and only collects garbage when a
+# frame has time to spare or nobody is playing, instead of whenever CPython
+# decides to.
+GC_CONTROL = False
+# Records the frames that are shown, CAPTURE_FRAMES_PER_SECOND of them a
+# second, to CAPTURE_PATH: a directory of PNG files with CAPTURE_FORMAT "png",
+# or one raw RGB24 file with "raw". Needs NumPy and the surface renderer.
+CAPTURE_PATH = None
+CAPTURE_FRAMES_PER_SECOND = 30
+CAPTURE_FORMAT = "png"
+# Set to False for no sound. It is also off without NumPy or an audio device.
+SOUND = True
+IMAGE_FILES = {
+    "player": "player.png",
+    "player_shot": "basic_shot.png",
+    "alien": "enemy1.png",
+    "alien_shot": "enemy1_shot.png",
+}
+
+KEY_BINDINGS = {
+    pygame.K_a: "left",
+    pygame.K_d: "right",
+    pygame.K_w: "up",
+    pygame.K_s: "down",
+    pygame.K_RETURN: "fire",
+    pygame.K_p: "pause",
+}
+GAMEPAD_BUTTON_BINDINGS = {
+    0: "fire",
+    7: "pause",
+}
+GAMEPAD_AXIS_BINDINGS = {
+    0: ("left", "right"),
+    1: ("up", "down"),
+}
+GAMEPAD_DEAD_ZONE = 0.5
+
+# Every other kind of event is thrown away by SDL before it reaches the queue.
+INPUT_EVENTS = [
+    pygame.QUIT,
+    pygame.KEYDOWN,
+    pygame.KEYUP,
+    pygame.JOYBUTTONDOWN,
+    pygame.JOYBUTTONUP,
+    pygame.JOYAXISMOTION,
+    pygame.JOYHATMOTION,
+    pygame.JOYDEVICEADDED,
+    pygame.JOYDEVICEREMOVED,
+    pygame.WINDOWEXPOSED,
+    pygame.WINDOWFOCUSGAINED,
+    pygame.WINDOWFOCUSLOST,
+    pygame.WINDOWMINIMIZED,
+    pygame.WINDOWRESTORED,
+    renderers.FRAME_READY,
+]
+# Nothing moves on the title and game over screens or while paused, so the
+# game then sleeps until there is an event, at most IDLE_WAIT_SECONDS, and
+# only draws when the screen has to change. Without focus it runs at
+# UNFOCUSED_FRAMES_PER_SECOND, and minimized it draws nothing.
+IDLE_MODES = ["waiting", "gameover"]
+IDLE_WAIT_SECONDS = 1.0
+UNFOCUSED_FRAMES_PER_SECOND = 10
+
+# From the cheapest to the best looking. The governor starts at the last one
+# and steps down when the frame time budget is not being met.
+# Stars with a radius below star_min_radius are not drawn. A circle with a
+# radius of 0 draws nothing anyway.
+QUALITY_LEVELS = [
+    {"star_chance": 1 / 28, "star_min_radius": 2, "explosion_width": 4},
+    {"star_chance": 1 / 14, "star_min_radius": 2, "explosion_width": 4},
+    {"star_chance": 1 / 7, "star_min_radius": 2, "explosion_width": 0},
+    {"star_chance": 1 / 7, "star_min_radius": 1, "explosion_width": 0},
+]
 
 
 class Player:
+    __slots__ = ("rect", "x", "y", "area", "alive", "moved")
+    speed_pixels_per_second = 200
+
     def __init__(self, rect, area):
         self.rect = rect
         self.x = rect.x
         self.y = rect.y
-        self.speed_pixels_per_second = 200
         self.area = area
         self.alive = True
+        self.moved = (0, 0)
 
     def move(self, player_input, seconds):
+        old_x, old_y = self.rect.topleft
         if player_input.down and self.rect.bottom < self.area.bottom:
             self.y = self.y + self.speed_pixels_per_second * seconds
         if player_input.up and self.rect.top > self.area.top:
@@ -47,41 +177,101 @@ class Player:
             self.x = self.x - self.speed_pixels_per_second * seconds
         self.rect.x = self.x
         self.rect.y = self.y
+        self.moved = (self.rect.x - old_x, self.rect.y - old_y)
 
 class PlayerShot:
+    __slots__ = ("rect", "x", "moved", "index")
+    speed_pixels_per_second = 500
+
     def __init__(self, rect):
         self.rect = rect
         self.x = rect.x
-        self.speed_pixels_per_second = 500
+        self.moved = (0, 0)
+        self.index = None
 
     def update(self, seconds):
+        old_x = self.rect.x
         self.x = self.x + self.speed_pixels_per_second * seconds
         self.rect.x = self.x
+        self.moved = (self.rect.x - old_x, 0)
 
 class AlienShot:
+    __slots__ = ("rect", "x", "y", "speed_x", "speed_y", "moved", "index")
+
     def __init__(self, rect, speed_x, speed_y):
         self.rect = rect
         self.x = rect.x
         self.y = rect.y
         self.speed_x = speed_x
         self.speed_y = speed_y
+        self.moved = (0, 0)
+        self.index = None
 
     def update(self, seconds):
+        old_x, old_y = self.rect.topleft
         self.x = self.x + self.speed_x * seconds
         self.rect.x = self.x
         self.y = self.y + self.speed_y * seconds
         self.rect.y = self.y
+        self.moved = (self.rect.x - old_x, self.rect.y - old_y)
 
 
 class Alien:
-    def __init__(self, rect, movement_area, extra_speed):
-        self.rect = rect
-        self.x = rect.x
+    # Aliens do not move by themselves. Their position is their place in the
+    # formation plus how far the formation has moved, and the rect is only
+    # brought up to date when somebody looks at it.
+    __slots__ = ("formation", "emitter", "formation_rect", "current_rect", "current_move")
+
+    def __init__(self, rect):
+        self.formation = None
+        self.emitter = None
+        self.formation_rect = rect.copy()
+        self.current_rect = rect
+        self.current_move = 0
+
+    @property
+    def x(self):
+        return self.formation_rect.x + self.formation.x
+
+    @property
+    def rect(self):
+        if self.current_move != self.formation.moves:
+            self.current_rect.x = self.x
+            self.current_move = self.formation.moves
+        return self.current_rect
+
+
+class Formation:
+    # A wave of aliens moves as one block that turns around when its edge
+    # reaches the side of the movement area. Shots are tested against the
+    # rect around the whole block before the aliens in it.
+    def __init__(self, aliens, movement_area, extra_speed):
+        self.aliens = aliens
         self.movement_area = movement_area
         self.speed_pixels_per_second = 100 + extra_speed
         self.moving_left = True
+        self.x = 0.0
+        self.moves = 0
+        self.moved = (0, 0)
+        for alien in aliens:
+            alien.formation = self
+        self.update_bounds()
+
+    def update_bounds(self):
+        if self.aliens:
+            first = self.aliens[0].formation_rect
+            self.formation_bounds = first.unionall([alien.formation_rect for alien in self.aliens])
+        else:
+            self.formation_bounds = pygame.Rect(0, 0, 0, 0)
+        self.rect = self.formation_bounds.copy()
+        self.rect.x = self.formation_bounds.x + self.x
+
+    def remove(self, alien):
+        self.aliens.remove(alien)
+        self.update_bounds()
 
     def update(self, seconds):
+        old_x = self.rect.x
         if self.rect.left <= self.movement_area.left:
             self.moving_left = False
 
@@ -92,92 +282,225 @@ class Alien:
             self.x = self.x - self.speed_pixels_per_second * seconds
         else:
             self.x = self.x + self.speed_pixels_per_second * seconds
-        self.rect.x = self.x
+        self.rect.x = self.formation_bounds.x + self.x
+        self.moves = self.moves + 1
+        self.moved = (self.rect.x - old_x, 0)
 
 
 class Star:
+    # There are a lot of stars and they only ever need their position, so
+    # they do not carry a rect around. One is made when the star has to be
+    # checked against the game area.
+    __slots__ = ("x", "y", "color", "speed", "radius", "index")
+
     def __init__(self, x, y, radius, color, speed):
         self.x = x
         self.y = y
         self.color = color
         self.speed = speed
         self.radius = radius
-        self.rect = pygame.Rect((x - radius, y - radius),
-                                (2 * radius, 2 * radius))
+        self.index = None
+
+    @property
+    def rect(self):
+        rect = pygame.Rect((0, self.y - self.radius),
+                           (2 * self.radius, 2 * self.radius))
+        rect.x = self.x - self.radius
+        return rect
 
-    def move(self):
-        self.rect.x = self.rect.x - self.speed
+    def move(self, seconds):
+        self.x = self.x - self.speed * seconds
 
 class Explosion:
+    __slots__ = ("x", "y", "max_radius", "color", "current_radius", "growing")
+    grow_speed = 300
+    shrink_speed = 60
+
     def __init__(self, center, max_radius, color):
         self.x = center[0]
         self.y = center[1]
         self.max_radius = max_radius
         self.color = color
         self.current_radius = 0
-        self.grow_speed = 5
-        self.shrink_speed = 1
         self.growing = True
 
-    def update(self):
+    def update(self, seconds):
         if self.growing:
-            self.current_radius = self.current_radius + self.grow_speed
+            self.current_radius = self.current_radius + self.grow_speed * seconds
             if self.current_radius >= self.max_radius:
                 self.growing = False
         else:
-            self.current_radius = self.current_radius - self.shrink_speed
+            self.current_radius = self.current_radius - self.shrink_speed * seconds
 
     def done(self):
         return self.current_radius <= 0
 
 
-class PlayerInput:
+class PlayerInput(buttons.Buttons):
     def __init__(self):
-        self.stop = False
-        self.left = False
-        self.right = False
-        self.up = False
-        self.down = False
-        self.fire = False
+        super().__init__()
+        self.focused = True
+        self.minimized = False
+        self.exposed = False
+        self.key_bindings = dict(KEY_BINDINGS)
+        self.button_bindings = dict(GAMEPAD_BUTTON_BINDINGS)
+        self.collected_seconds = time.perf_counter()
+        # Set when input arrives, for a simulation thread that is asleep.
+        self.arrived = threading.Event()
+        self.gamepads = {}
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(INPUT_EVENTS)
+
+    def rebind_key(self, key, action):
+        for old_key, old_action in list(self.key_bindings.items()):
+            if old_action == action:
+                del self.key_bindings[old_key]
+        self.key_bindings[key] = action
 
     def update(self):
-        events = pygame.event.get()
-        for e in events:
+        self.collect()
+        self.apply_until(time.perf_counter())
+
+    def wait(self, seconds):
+        # Sleeps until there is an event or the time is up, then collects.
+        event = pygame.event.wait(max(1, int(seconds * 1000)))
+        if event.type == pygame.NOEVENT:
+            self.collect()
+        else:
+            self.collect([event])
+
+    def collect(self, events=()):
+        # Turns the waiting events into (time, action, pressed, since)
+        # entries in the input buffer. An event happened somewhere between
+        # the previous collection, since, and this one. QUIT and the window
+        # events take effect straight away.
+        now = time.perf_counter()
+        since = self.collected_seconds
+        self.collected_seconds = now
+        buffered = len(self.buffer)
+        for e in list(events) + pygame.event.get():
             if e.type == pygame.QUIT:
                 self.stop = True
 
-            elif e.type == pygame.KEYDOWN:
-                if e.key == pygame.K_a:
-                    self.left = True
-                if e.key == pygame.K_d:
-                    self.right = True
-                if e.key == pygame.K_s:
-                    self.down = True
-                if e.key == pygame.K_w:
-                    self.up = True
-                if e.key == pygame.K_RETURN:
-                    self.fire = True
-
-            elif e.type == pygame.KEYUP:
-                if e.key == pygame.K_a:
-                    self.left = False
-                if e.key == pygame.K_d:
-                    self.right = False
-                if e.key == pygame.K_s:
-                    self.down = False
-                if e.key == pygame.K_w:
-                    self.up = False
-                if e.key == pygame.K_RETURN:
-                    self.fire = False
+            elif e.type == pygame.WINDOWFOCUSGAINED or e.type == pygame.WINDOWFOCUSLOST:
+                self.focused = e.type == pygame.WINDOWFOCUSGAINED
+
+            elif e.type == pygame.WINDOWMINIMIZED or e.type == pygame.WINDOWRESTORED:
+                self.minimized = e.type == pygame.WINDOWMINIMIZED
+                self.exposed = True
+
+            elif e.type == pygame.WINDOWEXPOSED:
+                self.exposed = True
+
+            elif e.type == pygame.KEYDOWN or e.type == pygame.KEYUP:
+                action = self.key_bindings.get(e.key)
+                if action:
+                    self.buffer.append((now, action, e.type == pygame.KEYDOWN, since))
+
+            elif e.type == pygame.JOYBUTTONDOWN or e.type == pygame.JOYBUTTONUP:
+                action = self.button_bindings.get(e.button)
+                if action:
+                    self.buffer.append((now, action, e.type == pygame.JOYBUTTONDOWN, since))
+
+            elif e.type == pygame.JOYAXISMOTION:
+                if e.axis in GAMEPAD_AXIS_BINDINGS:
+                    negative, positive = GAMEPAD_AXIS_BINDINGS[e.axis]
+                    self.buffer.append((now, negative, e.value < -GAMEPAD_DEAD_ZONE, since))
+                    self.buffer.append((now, positive, e.value > GAMEPAD_DEAD_ZONE, since))
+
+            elif e.type == pygame.JOYHATMOTION:
+                hat_x, hat_y = e.value
+                self.buffer.append((now, "left", hat_x < 0, since))
+                self.buffer.append((now, "right", hat_x > 0, since))
+                self.buffer.append((now, "up", hat_y > 0, since))
+                self.buffer.append((now, "down", hat_y < 0, since))
+
+            elif e.type == pygame.JOYDEVICEADDED:
+                gamepad = pygame.joystick.Joystick(e.device_index)
+                self.gamepads[gamepad.get_instance_id()] = gamepad
+
+            elif e.type == pygame.JOYDEVICEREMOVED:
+                self.gamepads.pop(e.instance_id, None)
+        if self.stop or len(self.buffer) > buffered:
+            self.arrived.set()
+
+    def sleep_until_input(self, seconds):
+        # For a thread other than the one that collects the events.
+        self.arrived.wait(seconds)
+        self.arrived.clear()
+
+
+def convert_image(image):
+    # Without a display surface, as with the texture renderer, there is no
+    # pixel format to convert to, and the textures get converted anyway.
+    if pygame.display.get_surface() is None:
+        return image
+    return image.convert_alpha()
 
 
 class Graphics:
-    def __init__(self):
-        self.player = pygame.image.load("player.png").convert_alpha()
-        self.player_shot = pygame.image.load("basic_shot.png").convert_alpha()
-        self.alien = pygame.image.load("enemy1.png").convert_alpha()
-        self.alien_shot = pygame.image.load("enemy1_shot.png").convert_alpha()
-        self.status_font = pygame.font.Font(None, 40)
+    # The images and the font are decoded by an assets.AssetManager. Unless
+    # told not to wait, the constructor waits for them; otherwise the
+    # images are only there once loaded() has returned True, and text is
+    # left out until the font is in.
+    def __init__(self, scale=1.0, wait=True):
+        self.scale = scale
+        self.assets = assets.AssetManager()
+        self.assets.load("status_font", pygame.font.Font, None, max(8, round(40 * self.scale)))
+        for name, filename in IMAGE_FILES.items():
+            self.assets.load(name, pygame.image.load, filename, finish=convert_image)
+        self.is_loaded = False
+        self.text_images = {}
+        self.scaled = {}
+        self.canvas = None
+        if self.scale != 1:
+            window_width, window_height = pygame.display.get_surface().get_size()
+            canvas_size = (round(window_width * self.scale), round(window_height * self.scale))
+            self.canvas = pygame.Surface(canvas_size).convert()
+        self.masks = {}
+        self.overlap_cache = {}
+        self.quality = governor.Quality(len(QUALITY_LEVELS) - 1, QUALITY_LEVELS[-1])
+        if wait:
+            self.assets.wait()
+            self.loaded()
+
+    def loaded(self):
+        if self.is_loaded or not self.assets.ready():
+            return self.is_loaded
+        for name in IMAGE_FILES:
+            image = self.assets.get(name)
+            setattr(self, name, image)
+            self.masks[name] = pygame.mask.from_surface(image)
+            if self.scale != 1:
+                size = (max(1, round(image.get_width() * self.scale)),
+                        max(1, round(image.get_height() * self.scale)))
+                image = pygame.transform.smoothscale(image, size)
+            self.scaled[name] = image
+        self.is_loaded = True
+        return True
+
+    def text_image(self, text, color):
+        key = (text, color)
+        image = self.text_images.get(key)
+        if image is None:
+            status_font = self.assets.get("status_font", wait=False)
+            if status_font is None:
+                return None
+            image = status_font.render(text, True, color)
+            self.text_images[key] = image
+        return image
+
+    def masks_overlap(self, name_a, name_b, offset_x, offset_y):
+        # Every sprite of a kind shares one mask, so the answer only depends
+        # on the two kinds and how far apart they are.
+        key = (name_a, name_b, offset_x, offset_y)
+        overlap = self.overlap_cache.get(key)
+        if overlap is None:
+            mask_a = self.masks[name_a]
+            mask_b = self.masks[name_b]
+            overlap = mask_a.overlap(mask_b, (offset_x, offset_y)) is not None
+            self.overlap_cache[key] = overlap
+        return overlap
 
 
 class GameState:
@@ -190,26 +513,80 @@ class GameState:
         self.player = Player(player_rect, game_area)
         self.player_shots = []
         self.has_shot = False
+        self.shots_fired = 0
         self.stars = []
         self.wave_number = 0
-        self.aliens = make_wave(graphics, game_area, self.wave_number)
+        self.clock = timers.GameClock(GAME_SPEED)
+        # Stars and shots move in straight lines, so when they will leave
+        # the game area is known when they appear.
+        self.exits = timers.TimingWheel(1.0 / FRAMES_PER_SECOND)
+        self.has_paused = False
+        # The names of the sound effects that the last update set off.
+        self.sound_events = []
+        self.alien_fire_queue = timers.TimerQueue()
+        self.projectiles = projectiles.make_projectile_system(PROJECTILE_CAPACITY,
+                                                              graphics.alien_shot.get_size())
+        self.start_wave(graphics)
         self.alien_shots = []
         self.lives = 2
-        self.time_of_death = 0
         self.explosions = []
+        self.particles = particles.make_particle_system(PARTICLE_CAPACITY)
+        # Stars have their own random numbers, so changing the star density
+        # does not change what the aliens do.
+        self.star_random = random.Random(random.getrandbits(64))
 
+        star_chance = graphics.quality.star_chance
         for x in range(game_area.width):
-            if should_have_star():
-                star = random_star_for_x(x, game_area.height)
-                self.stars.append(star)
+            if should_have_star(star_chance, self.star_random):
+                star = random_star_for_x(x, game_area.height, self.star_random)
+                add_entity(self.stars, star)
+                self.retire_on_exit("stars", star, -star.speed, 0, 0.0)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["graphics"]
+        return state
+
+    def start_wave(self, graphics):
+        self.formation = make_wave(graphics, self.game_area, self.wave_number)
+        self.aliens = self.formation.aliens
+        if self.projectiles and self.wave_number >= PATTERN_WAVE:
+            for index, alien in enumerate(self.aliens):
+                settings = EMITTERS[index % len(EMITTERS)]
+                alien.emitter = projectiles.Emitter(**settings)
+        self.alien_fire_queue.clear()
+        for alien in self.aliens:
+            self.schedule_alien_fire(alien, self.clock.seconds)
+
+    def schedule_alien_fire(self, alien, after_seconds):
+        # The time between shots is exponentially distributed, which gives
+        # each alien the same chance of firing in any moment no matter how
+        # long the frames are. Inside a burst the volleys come at a fixed
+        # pace.
+        if alien.emitter is None:
+            due = after_seconds + random.expovariate(ALIEN_SHOTS_PER_SECOND)
+        elif alien.emitter.in_burst():
+            due = after_seconds + alien.emitter.volley_seconds
+        else:
+            due = after_seconds + random.expovariate(PATTERN_BURSTS_PER_SECOND)
+        self.alien_fire_queue.schedule(due, alien)
 
     def update(self, player_input, graphics, seconds):
-        if self.mode == "playing":
-            self.update_playing(player_input, graphics, seconds)
+        if player_input.pause and not self.has_paused and self.mode == "playing":
+            self.clock.paused = not self.clock.paused
+        self.has_paused = player_input.pause
+        self.sound_events.clear()
+
         if self.mode == "waiting":
+            # The clock waits with the title screen, so the first alien shots
+            # and the stars' exits are timed from when play starts.
             self.update_waiting(player_input, graphics)
-        if self.mode == "gameover":
-            self.update_gameover()
+            return
+        seconds = self.clock.tick(seconds)
+        if self.clock.paused:
+            return
+        if self.mode == "playing":
+            self.update_playing(player_input, graphics, seconds)
 
 
     def update_waiting(self, player_input, graphics):
@@ -218,128 +595,324 @@ class GameState:
             self.has_shot = True
 
 
-    def update_gameover(self):
-        if time.time() - self.gameover_time > 2:
-            self.mode = "restart"
+    def player_died(self):
+        if self.lives > 0:
+            self.clock.call_later(1, self.respawn)
+        else:
+            self.mode = "gameover"
+            self.clock.call_later(2, self.restart)
+
+
+    def respawn(self):
+        self.alien_shots = []
+        if self.projectiles:
+            self.projectiles.clear()
+        self.start_wave(self.graphics)
+        self.player.rect.midleft = (0, self.game_area.height // 2)
+        self.player.x = self.player.rect.x
+        self.player.y = self.player.rect.y
+        self.player.alive = True
+        self.lives = self.lives - 1
 
 
-    def update_playing(self, player_input, graphics, seconds):
-        if not self.player.alive and self.lives > 0 and time.time() - self.time_of_death > 1:
-            self.alien_shots = []
-            self.aliens = make_wave(graphics, self.game_area, self.wave_number)
-            self.player.rect.midleft = (0, self.game_area.height // 2)
-            self.player.x = self.player.rect.x
-            self.player.y = self.player.rect.y
-            self.player.alive = True
-            self.lives = self.lives - 1
-
-        if not self.player.alive and self.lives == 0:
-            self.mode = "gameover"
-            self.gameover_time = time.time()
+    def restart(self):
+        self.mode = "restart"
 
+
+    def update_playing(self, player_input, graphics, seconds):
         self.player.move(player_input, seconds)
 
         may_fire = not self.has_shot and self.player.alive
         if player_input.fire and may_fire:
             shot_coord = self.player.rect.midright
             new_shot = PlayerShot(graphics.player_shot.get_rect(center=shot_coord))
-            self.player_shots.append(new_shot)
+            add_entity(self.player_shots, new_shot)
+            self.retire_on_exit("player_shots", new_shot, new_shot.speed_pixels_per_second, 0,
+                                self.clock.seconds - seconds)
+            self.shots_fired = self.shots_fired + 1
+            self.sound_events.append("fire")
             self.has_shot = True
         elif not player_input.fire:
             self.has_shot = False
 
         for star in self.stars:
-            star.move()
+            star.move(seconds)
 
         for shot in self.player_shots:
             shot.update(seconds)
-        self.reap_outsiders(self.player_shots)
 
         if len(self.aliens) == 0:
             self.wave_number = self.wave_number + 1
-            self.aliens = make_wave(graphics, self.game_area, self.wave_number)
+            self.sound_events.append("wave_start")
+            self.start_wave(graphics)
 
-        if should_have_star():
+        if should_have_star(graphics.quality.star_chance, self.star_random):
             star = random_star_for_x(self.game_area.width,
-                                    self.game_area.height)
-            self.stars.append(star)
-        self.reap_outsiders(self.stars)
+                                    self.game_area.height,
+                                    self.star_random)
+            add_entity(self.stars, star)
+            self.retire_on_exit("stars", star, -star.speed, 0, self.clock.seconds)
 
-        for alien in self.aliens:
-            alien.update(seconds)
+        self.formation.update(seconds)
 
-            if random.randint(1, 10000) > 9990:
-                center = alien.rect.center
-                rect = self.graphics.alien_shot.get_rect(center=center)
-                if alien.rect.left < self.player.rect.right:
-                    direction_x = 1
+        for due, alien in self.alien_fire_queue.pop_due(self.clock.seconds):
+            if alien in self.aliens:
+                if alien.emitter is None:
+                    self.fire_alien_shot(alien, seconds)
                 else:
-                    direction_x = -1
-                if alien.rect.top < self.player.rect.bottom:
-                    direction_y = 1
-                else:
-                    direction_y = -1
-
-                shot = AlienShot(rect,
-                                 direction_x * 400,
-                                 random.uniform(-1 + 100 * direction_y,
-                                                 1 + 100 * direction_y))
-                self.alien_shots.append(shot)
+                    self.fire_alien_pattern(alien)
+                self.schedule_alien_fire(alien, due)
 
         for shot in self.alien_shots:
             shot.update(seconds)
-        self.reap_outsiders(self.alien_shots)
+        if self.projectiles:
+            self.projectiles.move(seconds)
 
+        # Shots are tested along the whole way they and their targets moved
+        # during the tick, so a long frame cannot carry a shot through an
+        # alien without hitting it.
+        formation_path = swept_rect(self.formation.rect, self.formation.moved)
         for shot in list(self.player_shots):
-            for alien in list(self.aliens):
-                if shot.rect.colliderect(alien.rect):
-                    if shot in self.player_shots:
-                        self.player_shots.remove(shot)
-                    if alien in self.aliens:
-                        self.aliens.remove(alien)
-                    explosion_center = alien.rect.center
-                    new_explosion = Explosion(explosion_center, 60, (255, 200, 0))
-                    self.explosions.append(new_explosion)
+            if not swept_rect(shot.rect, shot.moved).colliderect(formation_path):
+                continue
+            alien = self.first_alien_hit(graphics, shot)
+            if alien is not None:
+                remove_entity(self.player_shots, shot)
+                self.formation.remove(alien)
+                self.sound_events.append("alien_explosion")
+                explosion_center = alien.rect.center
+                new_explosion = Explosion(explosion_center, 60, (255, 200, 0))
+                self.explosions.append(new_explosion)
+                if self.particles:
+                    self.particles.emit(explosion_center, ALIEN_PARTICLES, 250,
+                                        [(255, 200, 0), (255, 130, 0), (255, 255, 160)], 0.8)
 
+        player = self.player
         for shot in list(self.alien_shots):
-            if shot.rect.colliderect(self.player.rect) and self.player.alive:
-                self.player.alive = False
-                self.time_of_death = time.time()
-                explosion_center = self.player.rect.center
-                new_explosion = Explosion(explosion_center, 200, (255, 50, 0))
-                self.explosions.append(new_explosion)
+            if not player.alive:
+                break
+            times = swept_overlap(shot.rect, shot.moved, player.rect, player.moved)
+            if times and precise_swept_hit(graphics, "alien_shot", shot.rect, shot.moved,
+                                           "player", player.rect, player.moved, times):
+                self.kill_player()
+
+        self.retire_exited()
+
+        if self.projectiles and player.alive:
+            shot_rect = graphics.alien_shot.get_rect()
+            xs, ys = self.projectiles.positions()
+            speed_x, speed_y = self.projectiles.speeds()
+            for index in self.projectiles.hits(player.rect, player.moved, seconds):
+                shot_rect.topleft = (xs[index], ys[index])
+                shot_moved = (speed_x[index] * seconds, speed_y[index] * seconds)
+                # The shot rect is rounded to whole pixels, so the overlap
+                # found from the arrays is trusted if this misses by a pixel.
+                times = swept_overlap(shot_rect, shot_moved, player.rect, player.moved)
+                if precise_swept_hit(graphics, "alien_shot", shot_rect, shot_moved, "player",
+                                     player.rect, player.moved, times or (0.0, 1.0)):
+                    self.kill_player()
+                    break
+        if self.projectiles:
+            self.projectiles.cull(self.game_area)
 
         for explosion in list(self.explosions):
-            explosion.update()
+            explosion.update(seconds)
             if explosion.done():
                 self.explosions.remove(explosion)
-
-    def reap_outsiders(self, objects):
-        for obj in list(objects):
-            if not self.game_area.colliderect(obj.rect):
-                objects.remove(obj)
-
-def should_have_star():
-    return random.choice([0, 0, 0, 0, 0, 0, 1])
-
-
-def random_star_for_x(x, height):
-    radius = random.randint(0, 2)
-    y = random.randint(0, height)
-    red = random.randint(230, 255)
-    blue = random.randint(100, 255)
-    green = random.randint(min(255, blue + 50), 255)
+        if self.particles:
+            self.particles.update(seconds)
+
+    def retire_on_exit(self, name, obj, speed_x, speed_y, now):
+        # Removes obj from the list with the given name when it has left the
+        # game area. obj must have been put in the list with add_entity.
+        # now is the game time at which obj is where it is.
+        # It is looked at a microsecond early, because the positions are
+        # added up tick by tick and can be a hair ahead of the sum here.
+        leave_seconds = seconds_to_leave(obj.rect, speed_x, speed_y, self.game_area)
+        if leave_seconds is not None:
+            self.exits.schedule(now + leave_seconds - 1e-6, (name, obj))
+
+    def retire_exited(self):
+        for due, (name, obj) in self.exits.pop_due(self.clock.seconds):
+            objects = getattr(self, name)
+            if not holds_entity(objects, obj):
+                continue
+            if self.game_area.colliderect(obj.rect):
+                # The rect is rounded to whole pixels, so it can be a pixel
+                # behind the exact position.
+                self.exits.schedule(due + self.exits.slot_seconds, (name, obj))
+            else:
+                remove_entity(objects, obj)
+
+    def first_alien_hit(self, graphics, shot):
+        # The alien the shot reached first during the tick, or None.
+        first_alien = None
+        first_time = None
+        for alien in self.aliens:
+            times = swept_overlap(shot.rect, shot.moved, alien.rect, self.formation.moved)
+            if times is None or (first_time is not None and times[0] >= first_time):
+                continue
+            if precise_swept_hit(graphics, "player_shot", shot.rect, shot.moved,
+                                 "alien", alien.rect, self.formation.moved, times):
+                first_alien = alien
+                first_time = times[0]
+        return first_alien
+
+    def kill_player(self):
+        self.player.alive = False
+        self.sound_events.append("player_death")
+        self.player_died()
+        explosion_center = self.player.rect.center
+        new_explosion = Explosion(explosion_center, 200, (255, 50, 0))
+        self.explosions.append(new_explosion)
+        if self.particles:
+            self.particles.emit(explosion_center, PLAYER_PARTICLES, 400,
+                                [(255, 50, 0), (255, 160, 0), (200, 200, 200)], 1.5)
+
+    def fire_alien_pattern(self, alien):
+        speed_x, speed_y = alien.emitter.fire(alien.rect.center, self.player.rect.center)
+        self.projectiles.spawn(alien.rect.center, speed_x, speed_y)
+
+    def fire_alien_shot(self, alien, seconds):
+        center = alien.rect.center
+        rect = self.graphics.alien_shot.get_rect(center=center)
+        if alien.rect.left < self.player.rect.right:
+            direction_x = 1
+        else:
+            direction_x = -1
+        if alien.rect.top < self.player.rect.bottom:
+            direction_y = 1
+        else:
+            direction_y = -1
+
+        shot = AlienShot(rect,
+                         direction_x * 400,
+                         random.uniform(-1 + 100 * direction_y,
+                                         1 + 100 * direction_y))
+        add_entity(self.alien_shots, shot)
+        self.retire_on_exit("alien_shots", shot, shot.speed_x, shot.speed_y,
+                            self.clock.seconds - seconds)
+
+def precise_hit(graphics, name_a, rect_a, name_b, rect_b):
+    # Only asked about rects that overlap, so it is only the sprites that
+    # are close to each other that pay for the mask test.
+    if not PRECISE_COLLISIONS:
+        return True
+    return graphics.masks_overlap(name_a, name_b, rect_b.x - rect_a.x, rect_b.y - rect_a.y)
+
+
+def seconds_to_leave(rect, speed_x, speed_y, area):
+    # How long a rect moving at a constant speed stays in area, or None if
+    # it never leaves. A rect that is not in area has already left. Rects
+    # round their position to the nearest pixel, so the rect is out once
+    # it is within half a pixel of the edge.
+    if not area.colliderect(rect):
+        return 0.0
+    times = []
+    if speed_x < 0:
+        times.append((rect.right - area.left - 0.5) / -speed_x)
+    elif speed_x > 0:
+        times.append((area.right - rect.left - 0.5) / speed_x)
+    if speed_y < 0:
+        times.append((rect.bottom - area.top - 0.5) / -speed_y)
+    elif speed_y > 0:
+        times.append((area.bottom - rect.top - 0.5) / speed_y)
+    if not times:
+        return None
+    return min(times)
+
+
+def add_entity(objects, obj):
+    # Stars and shots know where they are in their list, so that they can be
+    # found and removed without looking through it. The list's order is not
+    # kept: the last one is moved into the place of one that is removed.
+    obj.index = len(objects)
+    objects.append(obj)
+
+
+def remove_entity(objects, obj):
+    last = objects.pop()
+    if last is not obj:
+        objects[obj.index] = last
+        last.index = obj.index
+
+
+def holds_entity(objects, obj):
+    # False once obj has been removed, also when the list has been replaced.
+    return obj.index < len(objects) and objects[obj.index] is obj
+
+
+def swept_rect(rect, moved):
+    # The rect covering where rect was during the tick in which it moved.
+    return rect.union(rect.move(-moved[0], -moved[1]))
+
+
+def swept_overlap(rect_a, moved_a, rect_b, moved_b):
+    # rect_a and rect_b are where two things ended a tick during which they
+    # moved by moved_a and moved_b. Returns the parts of the tick, from 0 to
+    # 1, at which they started and stopped overlapping, or None if they did
+    # not overlap at all. Seen from b, a moves in a straight line, so this
+    # is a line test against b grown by the size of a, one axis at a time.
+    move_x = moved_a[0] - moved_b[0]
+    move_y = moved_a[1] - moved_b[1]
+    enter = 0.0
+    leave = 1.0
+    axes = [(rect_a.x - move_x, move_x, rect_a.width, rect_b.left, rect_b.right),
+            (rect_a.y - move_y, move_y, rect_a.height, rect_b.top, rect_b.bottom)]
+    for start, move, size, low, high in axes:
+        if move == 0:
+            if start + size <= low or start >= high:
+                return None
+            continue
+        time_low = (low - size - start) / move
+        time_high = (high - start) / move
+        enter = max(enter, min(time_low, time_high))
+        leave = min(leave, max(time_low, time_high))
+        if enter >= leave:
+            return None
+    return enter, leave
+
+
+def precise_swept_hit(graphics, name_a, rect_a, moved_a, name_b, rect_b, moved_b, times):
+    # Tests the masks every couple of pixels along the part of the tick in
+    # which the rects overlap.
+    if not PRECISE_COLLISIONS:
+        return True
+    enter, leave = times
+    move_x = moved_a[0] - moved_b[0]
+    move_y = moved_a[1] - moved_b[1]
+    distance = max(abs(move_x), abs(move_y)) * (leave - enter)
+    steps = int(distance / 2) + 1
+    for step in range(steps + 1):
+        back = 1 - (enter + (leave - enter) * step / steps)
+        offset_x = (rect_b.x - moved_b[0] * back) - (rect_a.x - moved_a[0] * back)
+        offset_y = (rect_b.y - moved_b[1] * back) - (rect_a.y - moved_a[1] * back)
+        if graphics.masks_overlap(name_a, name_b, round(offset_x), round(offset_y)):
+            return True
+    return False
+
+
+def should_have_star(star_chance, star_random):
+    return star_random.random() < star_chance
+
+
+def random_star_for_x(x, height, star_random):
+    radius = star_random.randint(0, 2)
+    y = star_random.randint(0, height)
+    red = star_random.randint(230, 255)
+    blue = star_random.randint(100, 255)
+    green = star_random.randint(min(255, blue + 50), 255)
 
     color = (red, green, blue)
-    speed = random.randint(1, 3)
+    speed = star_random.randint(1, 3) * 60
     star = Star(x, y, radius, color, speed)
     return star
 
-def make_alien(graphics, game_area, x, y, extra_speed):
+def make_alien(graphics, game_area, x, y):
     width = game_area.width
     height = game_area.height
     alien_rect = graphics.alien.get_rect(center=(width + x, height // 2 + y))
-    alien = Alien(alien_rect, game_area, extra_speed)
+    alien = Alien(alien_rect)
     return alien
 
 
@@ -347,111 +920,663 @@ def make_wave(graphics, game_area, wave_number):
     extra_speed = 20 * wave_number // 3
 
     if wave_number % 3 == 0:
-        return [make_alien(graphics, game_area, 10, 0, extra_speed),
-                make_alien(graphics, game_area, 100, 0, extra_speed),
-                make_alien(graphics, game_area, 200, 0, extra_speed),
-                make_alien(graphics, game_area, 300, 0, extra_speed),
-                make_alien(graphics, game_area, 400, 0, extra_speed)]
+        aliens = [make_alien(graphics, game_area, 10, 0),
+                  make_alien(graphics, game_area, 100, 0),
+                  make_alien(graphics, game_area, 200, 0),
+                  make_alien(graphics, game_area, 300, 0),
+                  make_alien(graphics, game_area, 400, 0)]
 
     elif wave_number % 3 == 1:
-        return [make_alien(graphics, game_area, 10, 0, extra_speed),
-                make_alien(graphics, game_area, 100, 50, extra_speed),
-                make_alien(graphics, game_area, 100, -50, extra_speed),
-                make_alien(graphics, game_area, 200, 100, extra_speed),
-                make_alien(graphics, game_area, 200, -100, extra_speed)]
+        aliens = [make_alien(graphics, game_area, 10, 0),
+                  make_alien(graphics, game_area, 100, 50),
+                  make_alien(graphics, game_area, 100, -50),
+                  make_alien(graphics, game_area, 200, 100),
+                  make_alien(graphics, game_area, 200, -100)]
     else:
-        return [make_alien(graphics, game_area, 10, 0, extra_speed),
-                make_alien(graphics, game_area, 100, -50, extra_speed),
-                make_alien(graphics, game_area, 100, 0, extra_speed),
-                make_alien(graphics, game_area, 100, 50, extra_speed),
-                make_alien(graphics, game_area, 200, -100, extra_speed),
-                make_alien(graphics, game_area, 200, -50, extra_speed),
-                make_alien(graphics, game_area, 200, 0, extra_speed),
-                make_alien(graphics, game_area, 200, 50, extra_speed),
-                make_alien(graphics, game_area, 200, 100, extra_speed)]
-
-
-def paint_screen(window, game_state, graphics):
-    window.fill((0, 0, 0))
+        aliens = [make_alien(graphics, game_area, 10, 0),
+                  make_alien(graphics, game_area, 100, -50),
+                  make_alien(graphics, game_area, 100, 0),
+                  make_alien(graphics, game_area, 100, 50),
+                  make_alien(graphics, game_area, 200, -100),
+                  make_alien(graphics, game_area, 200, -50),
+                  make_alien(graphics, game_area, 200, 0),
+                  make_alien(graphics, game_area, 200, 50),
+                  make_alien(graphics, game_area, 200, 100)]
+    return Formation(aliens, game_area, extra_speed)
+
+
+def step_game(game_state, player_input, graphics, seconds):
+    if game_state.mode == "restart":
+        game_state = GameState(game_state.graphics, game_state.game_area)
+    game_state.update(player_input, graphics, seconds)
+    return game_state
+
+
+def paint_screen(screen, game_state, graphics):
+    screen.clear()
     if game_state.mode == "playing":
-        paint_screen_playing(window, game_state, graphics)
+        paint_screen_playing(screen, game_state, graphics)
     if game_state.mode == "waiting":
-        paint_screen_waiting(window, graphics)
+        paint_screen_waiting(screen, graphics)
     if game_state.mode == "gameover":
-        paint_screen_gameover(window, graphics)
-    pygame.display.flip()
+        paint_screen_gameover(screen, graphics)
+    screen.present()
 
 
-def paint_screen_playing(window, game_state, graphics):
-    game_area = game_state.game_area
-    status_line_height = window.get_rect().height - game_area.height
-    game_surface = window.subsurface(game_area.move(0, status_line_height))
+def paint_screen_playing(screen, game_state, graphics):
+    screen.enter_game_area(game_state.game_area)
     for star in game_state.stars:
-        pygame.draw.circle(game_surface, star.color,
-                           (star.rect.x, star.rect.y),
-                           star.radius)
+        paint_star(screen, star.color, star.x - star.radius, star.y - star.radius,
+                   star.radius, graphics)
 
     if game_state.player.alive:
-        game_surface.blit(graphics.player, game_state.player.rect)
+        screen.sprite("player", game_state.player.rect.x, game_state.player.rect.y)
 
     for shot in game_state.player_shots:
-        game_surface.blit(graphics.player_shot, shot.rect)
+        screen.sprite("player_shot", shot.rect.x, shot.rect.y)
 
     for alien in game_state.aliens:
-        game_surface.blit(graphics.alien, alien.rect)
+        screen.sprite("alien", alien.rect.x, alien.rect.y)
 
     for shot in game_state.alien_shots:
-        game_surface.blit(graphics.alien_shot, shot.rect)
+        screen.sprite("alien_shot", shot.rect.x, shot.rect.y)
 
-    for explosion in game_state.explosions:
-        pygame.draw.circle(game_surface, explosion.color, (explosion.x, explosion.y), explosion.current_radius)
-
-    lives_text = "Lives: " + str(game_state.lives)
-    text_image = graphics.status_font.render(lives_text, True, (150, 150, 150))
-    screen_rect = window.get_rect()
-    text_rect = text_image.get_rect(topright=screen_rect.topright).move(0, 8)
-    window.blit(text_image, text_rect)
+    if game_state.projectiles:
+        screen.sprites("alien_shot", *game_state.projectiles.positions())
 
+    for explosion in game_state.explosions:
+        paint_explosion(screen, explosion.color, explosion.x, explosion.y,
+                        explosion.current_radius, graphics)
+
+    if game_state.particles:
+        screen.particles(game_state.particles.frame())
+    screen.leave_game_area()
 
-def paint_screen_waiting(window, graphics):
-    text_image = graphics.status_font.render("Press fire to play", True, (255, 0, 0))
-    window_rect = window.get_rect()
-    text_rect = text_image.get_rect(center=window_rect.center)
-    window.blit(text_image, text_rect)
+    paint_lives(screen, game_state.lives, graphics)
+    if game_state.clock.paused:
+        paint_paused(screen, graphics)
+
+
+def paint_star(screen, color, x, y, radius, graphics):
+    if radius >= graphics.quality.star_min_radius:
+        screen.circle(color, x, y, radius)
+
+
+def paint_explosion(screen, color, x, y, radius, graphics):
+    screen.circle(color, x, y, radius, graphics.quality.explosion_width)
+
+
+def paint_lives(screen, lives, graphics):
+    screen.text("Lives: " + str(lives), (150, 150, 150), topright=(screen.width, 8))
+
+
+def paint_paused(screen, graphics):
+    screen.text("Paused", (255, 0, 0), center=(screen.width // 2, screen.height // 2))
+
+
+def paint_screen_waiting(screen, graphics):
+    screen.text("Press fire to play", (255, 0, 0),
+                center=(screen.width // 2, screen.height // 2))
+
+
+def paint_screen_loading(screen, graphics):
+    screen.clear()
+    paint_screen_waiting(screen, graphics)
+    done, count = graphics.assets.progress()
+    screen.text("Loading %d of %d" % (done, count), (150, 150, 150),
+                midtop=(screen.width // 2, screen.height // 2 + 30))
+    screen.present()
+
+
+def paint_screen_gameover(screen, graphics):
+    screen.text("Game Over", (255, 0, 0), center=(screen.width // 2, screen.height // 2))
+
+
+class RenderSnapshot:
+    # An immutable copy of what is needed to draw one simulation tick. The
+    # entity objects are kept only so the renderer can match an entity in
+    # two snapshots; holding on to them also stops their ids being reused.
+    def __init__(self, game_state, seconds):
+        self.seconds = seconds
+        self.mode = game_state.mode
+        self.game_area = game_state.game_area
+        self.lives = game_state.lives
+        self.paused = game_state.clock.paused
+        self.stars = tuple((star, star.x - star.radius, star.y - star.radius, star.radius, star.color)
+                           for star in game_state.stars)
+        sprites = []
+        if game_state.player.alive:
+            sprites.append(("player", game_state.player,
+                            game_state.player.x, game_state.player.y))
+        for shot in game_state.player_shots:
+            sprites.append(("player_shot", shot, shot.x, shot.rect.y))
+        for alien in game_state.aliens:
+            sprites.append(("alien", alien, alien.x, alien.rect.y))
+        for shot in game_state.alien_shots:
+            sprites.append(("alien_shot", shot, shot.x, shot.y))
+        self.sprites = tuple(sprites)
+        self.explosions = tuple((explosion, explosion.x, explosion.y,
+                                 explosion.current_radius, explosion.color)
+                                for explosion in game_state.explosions)
+        self.particles = None
+        if game_state.particles:
+            self.particles = game_state.particles.frame(copy=True)
+        self.projectiles = None
+        if game_state.projectiles:
+            self.projectiles = game_state.projectiles.positions(copy=True)
+
+
+class SnapshotBuffer:
+    def __init__(self, snapshot):
+        self.lock = threading.Lock()
+        self.snapshots = (snapshot, snapshot)
+        self.changed = threading.Event()
+
+    def publish(self, snapshot):
+        with self.lock:
+            self.snapshots = (self.snapshots[1], snapshot)
+        self.changed.set()
+
+    def wake(self):
+        self.changed.set()
+
+    def wait(self, seconds):
+        # Sleeps until a snapshot is published, wake is called or the time
+        # is up.
+        self.changed.wait(seconds)
+        self.changed.clear()
+
+    def latest_two(self):
+        with self.lock:
+            return self.snapshots
+
+
+class SimulationThread(threading.Thread):
+    def __init__(self, game_state, player_input, graphics, snapshots, replay_writer,
+                 latency_probe, collector, sound_player):
+        super().__init__(daemon=True)
+        self.sound_player = sound_player
+        self.latency_probe = latency_probe
+        self.collector = collector
+        self.game_state = game_state
+        self.player_input = player_input
+        self.graphics = graphics
+        self.snapshots = snapshots
+        self.replay_writer = replay_writer
+
+    def run(self):
+        tick_seconds = 1.0 / FRAMES_PER_SECOND
+        self.pacer = pacing.FramePacer(FRAMES_PER_SECOND, collector=self.collector)
+        while not self.player_input.stop:
+            self.player_input.apply_until(time.perf_counter())
+            if self.latency_probe:
+                self.latency_probe.inputs_applied(self.player_input.applied, self.game_state)
+            if self.replay_writer:
+                self.replay_writer.record(self.game_state, self.player_input, tick_seconds)
+            self.game_state = step_game(self.game_state, self.player_input,
+                                        self.graphics, tick_seconds)
+            play_sounds(self.sound_player, self.game_state)
+            self.snapshots.publish(RenderSnapshot(self.game_state, time.perf_counter()))
+            if self.latency_probe:
+                # Only once the snapshot is published can the next frame
+                # show the state.
+                self.latency_probe.state_updated(self.game_state)
+            unfocused = self.player_input.minimized or not self.player_input.focused
+            tick_seconds = throttle_simulation(self.game_state, self.pacer, unfocused,
+                                               self.player_input.sleep_until_input)
+
+
+def throttle_simulation(game_state, pacer, unfocused, sleep):
+    # Waits between the ticks of a simulation thread or process and returns
+    # how long the next tick is. On an idle screen it sleeps with
+    # sleep(seconds) until there is input or the clock's next timer is due,
+    # and without focus it ticks at UNFOCUSED_FRAMES_PER_SECOND.
+    if idle_screen(game_state.mode, game_state.clock.paused) is not None:
+        start = time.perf_counter()
+        wake_seconds = game_state.clock.real_seconds_to_next_timer()
+        if wake_seconds is None:
+            wake_seconds = IDLE_WAIT_SECONDS
+        sleep(min(wake_seconds, IDLE_WAIT_SECONDS))
+        pacer.resume()
+        if game_state.clock.paused:
+            # The time spent paused was not played, so the tick that
+            # un-pauses is an ordinary one.
+            return 1.0 / FRAMES_PER_SECOND
+        return max(1.0 / FRAMES_PER_SECOND, time.perf_counter() - start)
+    frames_per_second = FRAMES_PER_SECOND
+    if unfocused:
+        frames_per_second = UNFOCUSED_FRAMES_PER_SECOND
+    pacer.set_frames_per_second(frames_per_second)
+    pacer.wait()
+    return 1.0 / frames_per_second
+
+
+def blend(old, new, alpha):
+    return old + (new - old) * alpha
+
+
+def paint_screen_interpolated(screen, previous, latest, alpha, graphics):
+    screen.clear()
+    if latest.mode == "playing":
+        paint_screen_playing_interpolated(screen, previous, latest, alpha, graphics)
+    if latest.mode == "waiting":
+        paint_screen_waiting(screen, graphics)
+    if latest.mode == "gameover":
+        paint_screen_gameover(screen, graphics)
+    screen.present()
+
+
+def paint_screen_playing_interpolated(screen, previous, latest, alpha, graphics):
+    screen.enter_game_area(latest.game_area)
+
+    previous_stars = {id(star): x for star, x, y, radius, color in previous.stars}
+    for star, x, y, radius, color in latest.stars:
+        if id(star) in previous_stars:
+            x = blend(previous_stars[id(star)], x, alpha)
+        paint_star(screen, color, x, y, radius, graphics)
+
+    previous_sprites = {id(obj): (x, y) for name, obj, x, y in previous.sprites}
+    for name, obj, x, y in latest.sprites:
+        if id(obj) in previous_sprites:
+            old_x, old_y = previous_sprites[id(obj)]
+            x = blend(old_x, x, alpha)
+            y = blend(old_y, y, alpha)
+        screen.sprite(name, x, y)
+
+    if latest.projectiles:
+        screen.sprites("alien_shot", *latest.projectiles)
+
+    previous_explosions = {id(explosion): radius
+                           for explosion, x, y, radius, color in previous.explosions}
+    for explosion, x, y, radius, color in latest.explosions:
+        if id(explosion) in previous_explosions:
+            radius = blend(previous_explosions[id(explosion)], radius, alpha)
+        paint_explosion(screen, color, x, y, radius, graphics)
+
+    if latest.particles:
+        screen.particles(latest.particles)
+    screen.leave_game_area()
+
+    paint_lives(screen, latest.lives, graphics)
+    if latest.paused:
+        paint_paused(screen, graphics)
+
+
+def paint_shared_frame(screen, slot, game_area, graphics):
+    # Draws a slot of a simprocess.SharedFrame, without presenting it.
+    header = slot.header
+    mode = simprocess.MODES[header[simprocess.MODE]]
+    screen.clear()
+    if mode == "playing":
+        paint_shared_frame_playing(screen, slot, game_area, graphics)
+    if mode == "waiting":
+        paint_screen_waiting(screen, graphics)
+    if mode == "gameover":
+        paint_screen_gameover(screen, graphics)
+
+
+def paint_shared_frame_playing(screen, slot, game_area, graphics):
+    header = slot.header
+    screen.enter_game_area(game_area)
+    star_count = header[simprocess.STARS]
+    for (x, y, radius), color in zip(slot.stars[:star_count].tolist(),
+                                     slot.star_colors[:star_count].tolist()):
+        paint_star(screen, tuple(color), x, y, radius, graphics)
+
+    for name, xs, ys in slot.sprite_runs():
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            screen.sprite(name, x, y)
+
+    projectile_count = header[simprocess.PROJECTILES]
+    if projectile_count:
+        screen.sprites("alien_shot", slot.projectiles[0, :projectile_count],
+                       slot.projectiles[1, :projectile_count])
+
+    explosion_count = header[simprocess.EXPLOSIONS]
+    for (x, y, radius), color in zip(slot.explosions[:explosion_count].tolist(),
+                                     slot.explosion_colors[:explosion_count].tolist()):
+        paint_explosion(screen, tuple(color), x, y, radius, graphics)
+
+    particle_count = header[simprocess.PARTICLES]
+    if particle_count:
+        palette = [tuple(color) for color in slot.palette[:header[simprocess.PALETTE]].tolist()]
+        screen.particles(particles.ParticleFrame(slot.particles[0, :particle_count],
+                                                 slot.particles[1, :particle_count],
+                                                 slot.particle_colors[:particle_count],
+                                                 palette))
+    screen.leave_game_area()
+
+    paint_lives(screen, header[simprocess.LIVES], graphics)
+    if header[simprocess.PAUSED]:
+        paint_paused(screen, graphics)
+
+
+def make_governor(graphics):
+    if not ADAPTIVE_QUALITY:
+        return None
+    return governor.QualityGovernor(graphics.quality, QUALITY_LEVELS,
+                                    1.0 / FRAMES_PER_SECOND)
+
+
+class FrameThrottle:
+    # Decides how long each frame waits and whether it is drawn. shown is
+    # what an idle screen shows, or None when things are moving. Idle, it
+    # sleeps with sleep(seconds), which by default waits for an event.
+    def __init__(self, pacer, player_input, frames_per_second, sleep=None):
+        self.pacer = pacer
+        self.player_input = player_input
+        self.frames_per_second = frames_per_second
+        self.sleep = sleep or player_input.wait
+        self.idle = False
+        self.drawn = None
+        self.idle_meter = pacing.IdleMeter()
+
+    def wait(self, shown, wake_seconds=IDLE_WAIT_SECONDS):
+        player_input = self.player_input
+        self.idle_meter.frame_started(self.idle)
+        self.idle = shown is not None
+        if self.idle:
+            self.sleep(min(wake_seconds, IDLE_WAIT_SECONDS))
+            self.pacer.resume()
+        elif player_input.minimized:
+            self.sleep(1.0 / UNFOCUSED_FRAMES_PER_SECOND)
+            self.pacer.resume()
+        else:
+            if player_input.focused:
+                self.pacer.set_frames_per_second(self.frames_per_second)
+            else:
+                self.pacer.set_frames_per_second(UNFOCUSED_FRAMES_PER_SECOND)
+            self.pacer.wait()
+
+    def should_draw(self, shown):
+        player_input = self.player_input
+        if player_input.minimized:
+            self.drawn = None
+            return False
+        if shown is not None and shown == self.drawn and not player_input.exposed:
+            return False
+        self.drawn = shown
+        player_input.exposed = False
+        return True
+
+
+def idle_screen(mode, paused):
+    if mode in IDLE_MODES or paused:
+        return (mode, paused)
+    return None
+
+
+def play_sounds(sound_player, game_state):
+    if sound_player:
+        sound_player.play_all(game_state.sound_events)
+        sound_player.frame_done()
+
+
+class PaintThread(threading.Thread):
+    # Draws the frames of threaded_loop into a BufferedSurfaceRenderer,
+    # placing everything between the two newest ticks. Only showing the
+    # frames is left to the main thread.
+    def __init__(self, screen, snapshots, player_input, graphics, collector):
+        super().__init__(daemon=True)
+        self.screen = screen
+        self.snapshots = snapshots
+        self.player_input = player_input
+        self.graphics = graphics
+        self.collector = collector
+        self.pacer = pacing.FramePacer(RENDER_FRAMES_PER_SECOND, collector=collector)
+        self.throttle = FrameThrottle(self.pacer, player_input, RENDER_FRAMES_PER_SECOND,
+                                      snapshots.wait)
+
+    def run(self):
+        tick_seconds = 1.0 / FRAMES_PER_SECOND
+        quality_governor = make_governor(self.graphics)
+        while not self.player_input.stop:
+            frame_start = time.perf_counter()
+            previous, latest = self.snapshots.latest_two()
+            shown = idle_screen(latest.mode, latest.paused)
+            if self.throttle.should_draw(shown):
+                alpha = min(1.0, (frame_start - latest.seconds) / tick_seconds)
+                paint_screen_interpolated(self.screen, previous, latest, alpha, self.graphics)
+                if quality_governor and shown is None:
+                    quality_governor.frame_finished(time.perf_counter() - frame_start)
+            self.collector.frame_done(latest.mode, self.pacer.spare_seconds())
+            # The simulation thread changes the mode, so an idle screen is
+            # looked at again when it publishes, or soon anyway.
+            self.throttle.wait(shown, 0.1)
+
+
+def threaded_loop(screen, game_state, player_input, graphics, replay_writer,
+                  latency_probe, collector, sound_player):
+    # The simulation ticks at FRAMES_PER_SECOND on its own thread, and a
+    # paint thread draws as often as the display allows. Events can only be
+    # read on the thread that made the window, so this one does nothing
+    # else but put the painted frames on the window, and a slow frame holds
+    # up neither the input nor the simulation.
+    snapshots = SnapshotBuffer(RenderSnapshot(game_state, time.perf_counter()))
+    simulation = SimulationThread(game_state, player_input, graphics,
+                                  snapshots, replay_writer, latency_probe, collector,
+                                  sound_player)
+    painted = renderers.BufferedSurfaceRenderer(screen.window, graphics)
+    painted.capture = screen.capture
+    painter = PaintThread(painted, snapshots, player_input, graphics, collector)
+    simulation.start()
+    painter.start()
+    while not player_input.stop:
+        # Wakes for input and for each painted frame.
+        player_input.wait(IDLE_WAIT_SECONDS)
+        if player_input.exposed:
+            snapshots.wake()
+        if painted.show() and latency_probe:
+            latency_probe.frame_presented()
+    simulation.join()
+    painter.join()
+    logging.info(simulation.pacer.report("Simulation ticks"))
+    logging.info(painter.pacer.report("Rendered frames"))
+    logging.info(painter.throttle.idle_meter.report())
+
+
+def process_loop(screen, game_state, player_input, graphics, collector):
+    # The simulation runs in a process of its own, and this one handles the
+    # events and draws the newest tick straight from shared memory. If the
+    # simulation wrote over the tick while it was being drawn, it is drawn
+    # again from the newer one before it is shown.
+    simulation = simprocess.SimulationProcess(game_state, PROJECTILE_CAPACITY,
+                                              PARTICLE_CAPACITY)
+    quality_governor = make_governor(graphics)
+    pacer = pacing.FramePacer(RENDER_FRAMES_PER_SECOND, sleep=not VSYNC, collector=collector)
+    throttle = FrameThrottle(pacer, player_input, RENDER_FRAMES_PER_SECOND)
+    throttle.idle_meter = pacing.IdleMeter(simulation.cpu_seconds)
+    torn_frames = 0
+    try:
+        while not player_input.stop:
+            frame_start = time.perf_counter()
+            player_input.collect()
+            simulation.send_input(player_input.buffer)
+            simulation.set_quality_level(graphics.quality.level)
+            simulation.set_unfocused(player_input.minimized or not player_input.focused)
+            slot = None
+            if simulation.alive():
+                slot, sequence = simulation.frame.newest()
+            if slot is None:
+                logging.error("The simulation process stopped with exit code %s",
+                              simulation.process.exitcode)
+                break
+            mode = simprocess.MODES[slot.header[simprocess.MODE]]
+            shown = idle_screen(mode, bool(slot.header[simprocess.PAUSED]))
+            if throttle.should_draw(shown):
+                while True:
+                    paint_shared_frame(screen, slot, game_state.game_area, graphics)
+                    if simulation.frame.still_valid(slot, sequence):
+                        break
+                    torn_frames = torn_frames + 1
+                    slot, sequence = simulation.frame.newest()
+                    if slot is None:
+                        break
+                screen.present()
+                if quality_governor and shown is None:
+                    quality_governor.frame_finished(time.perf_counter() - frame_start)
+            collector.frame_done(mode, pacer.spare_seconds())
+            throttle.wait(shown, 0.1)
+    finally:
+        # Also when the simulation process has died, so that the shared
+        # memory does not outlive the game.
+        simulation.stop()
+    logging.info(pacer.report("Rendered frames"))
+    logging.info(throttle.idle_meter.report())
+    logging.info("Frames drawn again after the simulation overtook them: %d", torn_frames)
+
+
+def serial_loop(screen, game_state, player_input, graphics, replay_writer,
+                latency_probe, collector, sound_player):
+    quality_governor = make_governor(graphics)
+    pacer = pacing.FramePacer(FRAMES_PER_SECOND, sleep=not VSYNC, collector=collector)
+    throttle = FrameThrottle(pacer, player_input, FRAMES_PER_SECOND)
+    previous_seconds = time.perf_counter()
+    while not player_input.stop:
+        # Idle, the game only has to wake up for its clock's next timer,
+        # like the one that restarts it after game over.
+        wake_seconds = game_state.clock.real_seconds_to_next_timer()
+        if wake_seconds is None:
+            wake_seconds = IDLE_WAIT_SECONDS
+        paused = game_state.clock.paused
+        throttle.wait(idle_screen(game_state.mode, paused), wake_seconds)
+        frame_start = time.perf_counter()
+        elapsed_seconds = frame_start - previous_seconds
+        previous_seconds = frame_start
+        if paused and throttle.idle:
+            # The time spent waiting while paused was not played, so the
+            # step that un-pauses is only one tick long.
+            elapsed_seconds = min(elapsed_seconds, 1.0 / FRAMES_PER_SECOND)
+        player_input.update()
+        if latency_probe:
+            latency_probe.inputs_applied(player_input.applied, game_state)
+        if replay_writer:
+            replay_writer.record(game_state, player_input, elapsed_seconds)
+        game_state = step_game(game_state, player_input, graphics, elapsed_seconds)
+        play_sounds(sound_player, game_state)
+        if latency_probe:
+            latency_probe.state_updated(game_state)
+        shown = idle_screen(game_state.mode, game_state.clock.paused)
+        if throttle.should_draw(shown):
+            paint_screen(screen, game_state, graphics)
+            if latency_probe:
+                latency_probe.frame_presented()
+            if quality_governor and shown is None:
+                quality_governor.frame_finished(time.perf_counter() - frame_start)
+        collector.frame_done(game_state.mode, pacer.spare_seconds())
+    logging.info(pacer.report("Frames"))
+    logging.info(throttle.idle_meter.report())
+
+
+def open_screen(screen_size, wait=True, renderer=None):
+    if renderer is None:
+        renderer = RENDERER
+    if renderer == "texture":
+        from pygame._sdl2 import video
+        if RENDER_SCALE != 1:
+            logging.warning("RENDER_SCALE only applies to the surface renderer")
+        window = video.Window("Sideways", screen_size)
+        graphics = Graphics(1.0, wait)
+        return renderers.TextureRenderer(window, graphics, screen_size, VSYNC), graphics
+
+    if VSYNC or SCALED_WINDOW:
+        # SDL only offers vsync for windows it scales or draws with OpenGL.
+        window = pygame.display.set_mode(screen_size, pygame.SCALED, vsync=int(VSYNC))
+    else:
+        window = pygame.display.set_mode(screen_size)
+    graphics = Graphics(RENDER_SCALE, wait)
+    return renderers.SurfaceRenderer(window, graphics), graphics
 
 
-def paint_screen_gameover(window, graphics):
-    text_image = graphics.status_font.render("Game Over", True, (255, 0, 0))
-    window_rect = window.get_rect()
-    text_rect = text_image.get_rect(center=window_rect.center)
-    window.blit(text_image, text_rect)
+def wait_for_assets(screen, graphics, player_input):
+    # Shows the waiting screen with how far loading has got until the
+    # required assets are in. Returns False if the player quit before that.
+    pacer = pacing.FramePacer(FRAMES_PER_SECOND)
+    start = time.perf_counter()
+    while not graphics.loaded():
+        player_input.update()
+        if player_input.stop:
+            return False
+        paint_screen_loading(screen, graphics)
+        pacer.wait()
+    logging.info("Assets loaded in %.0f ms", (time.perf_counter() - start) * 1000)
+    return True
 
 
 def main_loop():
+    logging.basicConfig(level=logging.INFO)
+    sounds.pre_init()
     pygame.init()
     screen_width = 800
     screen_height = 600
-    window = pygame.display.set_mode((screen_width, screen_height))
+    use_process = SIMULATION_PROCESS and simprocess.numpy is not None
+    if SIMULATION_PROCESS and not use_process:
+        logging.warning("The simulation process needs NumPy, running in one process")
+    renderer = RENDERER
+    if RENDER_THREAD and not use_process and renderer != "surface":
+        # SDL's renderer can only be used on the window's thread, and the
+        # threaded loop draws on a thread of its own.
+        logging.warning("The render thread draws with the surface renderer")
+        renderer = "surface"
+    screen, graphics = open_screen((screen_width, screen_height), False, renderer)
     game_area = pygame.Rect((0, 0), (screen_width, screen_height - 40))
 
-    graphics = Graphics()
-    game_state = GameState(graphics, game_area)
-    player_input = PlayerInput()
+    frame_capture = None
+    if CAPTURE_PATH and renderer != "surface":
+        logging.warning("Frames are only captured with the surface renderer")
+    elif CAPTURE_PATH:
+        frame_capture = capture.make_frame_capture(CAPTURE_PATH, CAPTURE_FRAMES_PER_SECOND,
+                                                   screen.window, CAPTURE_FORMAT)
+        if frame_capture is None:
+            logging.warning("Capturing frames needs NumPy")
+        screen.capture = frame_capture
 
-    previous_seconds = time.time()
-    while not player_input.stop:
-        if game_state.mode == "restart":
-            game_state = GameState(game_state.graphics, game_state.game_area)
-
-        current_seconds = time.time()
-        elapsed_seconds = current_seconds - previous_seconds
-        previous_seconds = current_seconds
-        delay_seconds = max(0.0, 1.0 / FRAMES_PER_SECOND - elapsed_seconds)
-        pygame.time.delay(int(delay_seconds * 1000))
-        player_input.update()
-        game_state.update(player_input, graphics, elapsed_seconds)
-        paint_screen(window, game_state, graphics)
+    player_input = PlayerInput()
+    if not wait_for_assets(screen, graphics, player_input):
+        if frame_capture:
+            frame_capture.close()
+        graphics.assets.close()
+        pygame.quit()
+        return
+    game_state = GameState(graphics, game_area)
+    replay_writer = None
+    if REPLAY_FILE and not use_process:
+        # In a simulation process the replay is written by that process.
+        replay_writer = replay.ReplayWriter(REPLAY_FILE)
+    latency_probe = None
+    if LATENCY_FILE and use_process:
+        logging.warning("Latency is not measured with a simulation process")
+    elif LATENCY_FILE:
+        latency_probe = latency.LatencyProbe(LATENCY_FILE)
+
+    collector = gccontrol.Collector(GC_CONTROL)
+    sound_player = None
+    if SOUND and not use_process:
+        # A simulation process plays the sounds itself.
+        sound_player = sounds.make_sound_player(graphics.assets)
+
+    if use_process:
+        process_loop(screen, game_state, player_input, graphics, collector)
+    elif RENDER_THREAD:
+        threaded_loop(screen, game_state, player_input, graphics, replay_writer,
+                      latency_probe, collector, sound_player)
+    else:
+        serial_loop(screen, game_state, player_input, graphics, replay_writer,
+                    latency_probe, collector, sound_player)
+    logging.info(collector.report())
+    if sound_player:
+        logging.info(sound_player.report())
+    if frame_capture:
+        frame_capture.close()
+        logging.info(frame_capture.report())
+    collector.close()
+    if replay_writer:
+        replay_writer.close()
+    if latency_probe:
+        latency_probe.close()
+    graphics.assets.close()
     pygame.quit()
 
 
-main_loop()
+if __name__ == "__main__":
+    main_loop()
@@ -0,0 +1,104 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Control over when CPython's cyclic garbage collector runs. Left alone it
+# runs whenever enough objects have been allocated, which can be in the
+# middle of a frame. With idle_only the objects made at startup are frozen
+# so collections never look at them again, automatic collection is turned
+# off, and the young objects are collected in the spare time before a
+# frame's deadline, or all at once while nobody is playing.
+#
+# Either way every collection is timed, whoever started it, so the frame
+# pacers can tell how many of the slow frames had a collection in them.
+
+import gc
+import time
+
+IDLE_COLLECT_SECONDS = 0.002
+IDLE_COLLECT_OBJECTS = 100
+# If the frames never have time to spare, collect anyway once this many
+# objects have piled up, so memory does not grow without bound.
+FORCE_COLLECT_OBJECTS = 20000
+QUIET_MODES = ["waiting", "gameover"]
+
+
+class Collector:
+    def __init__(self, idle_only):
+        self.idle_only = idle_only
+        self.started = None
+        self.count = 0
+        self.seconds = 0.0
+        self.longest = 0.0
+        self.generations = [0, 0, 0]
+        self.collected_quiet = False
+        if idle_only:
+            # Everything alive now lives as long as the game does.
+            gc.collect()
+            gc.freeze()
+            gc.disable()
+        gc.callbacks.append(self.callback)
+
+    def callback(self, phase, info):
+        if phase == "start":
+            self.started = time.perf_counter()
+        elif self.started is not None:
+            pause = time.perf_counter() - self.started
+            self.started = None
+            self.count = self.count + 1
+            self.seconds = self.seconds + pause
+            self.longest = max(self.longest, pause)
+            self.generations[info["generation"]] = self.generations[info["generation"]] + 1
+
+    def frame_done(self, mode, spare_seconds):
+        if not self.idle_only:
+            return
+        if mode in QUIET_MODES:
+            if not self.collected_quiet:
+                gc.collect()
+                self.collected_quiet = True
+            return
+        self.collected_quiet = False
+
+        young = gc.get_count()[0]
+        has_time = spare_seconds > IDLE_COLLECT_SECONDS
+        if young > FORCE_COLLECT_OBJECTS or (young > IDLE_COLLECT_OBJECTS and has_time):
+            # The older generations are collected along with the young one
+            # as often as gc itself would.
+            threshold_0, threshold_1, threshold_2 = gc.get_threshold()
+            count_0, count_1, count_2 = gc.get_count()
+            generation = 0
+            if count_1 >= threshold_1:
+                generation = 1
+                if count_2 >= threshold_2:
+                    generation = 2
+            gc.collect(generation)
+
+    def report(self):
+        return "Collector pauses: %d (generations %d/%d/%d), %.2f ms in all, longest %.2f ms" % (
+            self.count, self.generations[0], self.generations[1], self.generations[2],
+            self.seconds * 1000, self.longest * 1000)
+
+    def close(self):
+        gc.callbacks.remove(self.callback)
+        if self.idle_only:
+            gc.enable()
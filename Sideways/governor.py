@@ -0,0 +1,82 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# The governor lowers the quality level when frames take too long and raises
+# it again once there is plenty of time to spare. The two thresholds are far
+# apart and a change must be followed by a full window of new measurements
+# before the next one, so the level does not flip back and forth.
+
+import collections
+import logging
+
+DOWNGRADE_FRACTION = 0.9
+UPGRADE_FRACTION = 0.5
+UPGRADE_WINDOWS = 3
+
+log = logging.getLogger("governor")
+
+
+class Quality:
+    def __init__(self, level, settings):
+        self.apply(level, settings)
+
+    def apply(self, level, settings):
+        self.level = level
+        for name, value in settings.items():
+            setattr(self, name, value)
+
+
+class QualityGovernor:
+    def __init__(self, quality, levels, frame_budget_seconds, window_frames=60):
+        self.quality = quality
+        self.levels = levels
+        self.frame_budget_seconds = frame_budget_seconds
+        self.frame_times = collections.deque(maxlen=window_frames)
+        self.frames_since_change = 0
+        self.calm_windows = 0
+
+    def set_level(self, level, reason):
+        log.info("Quality level %d -> %d (%s)", self.quality.level, level, reason)
+        self.quality.apply(level, self.levels[level])
+        self.frame_times.clear()
+        self.frames_since_change = 0
+        self.calm_windows = 0
+
+    def frame_finished(self, frame_seconds):
+        self.frame_times.append(frame_seconds)
+        self.frames_since_change = self.frames_since_change + 1
+        if self.frames_since_change < self.frame_times.maxlen:
+            return
+
+        slow_frame = sorted(self.frame_times)[len(self.frame_times) * 9 // 10]
+        level = self.quality.level
+        if slow_frame > self.frame_budget_seconds * DOWNGRADE_FRACTION and level > 0:
+            self.set_level(level - 1, "90th percentile frame took %.1f ms" % (slow_frame * 1000))
+        elif slow_frame < self.frame_budget_seconds * UPGRADE_FRACTION and level < len(self.levels) - 1:
+            self.calm_windows = self.calm_windows + 1
+            self.frames_since_change = 0
+            if self.calm_windows >= UPGRADE_WINDOWS:
+                self.set_level(level + 1, "90th percentile frame took %.1f ms" % (slow_frame * 1000))
+        else:
+            self.calm_windows = 0
+            self.frames_since_change = 0
@@ -0,0 +1,123 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Measures how long it takes from a key press until the first frame that
+# shows its result has been flipped to the display. A fire press is done
+# when a new player shot exists, a movement press when the player has moved.
+# Presses that have had no effect by the time the key is let go, like
+# moving into a wall, are not counted.
+#
+# pygame does not say when an event happened, only that it was waiting when
+# the queue was read, so each press is only known to lie between two reads.
+# The latency is kept as a range: "min" is timed from the read that found
+# the press, "max" from the read before it.
+
+import collections
+import threading
+import time
+
+MOVEMENT_ACTIONS = ["left", "right", "up", "down"]
+GIVE_UP_SECONDS = 1.0
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, len(sorted_values) * percent // 100)
+    return sorted_values[index]
+
+
+class LatencyProbe:
+    def __init__(self, path, export_seconds=5.0, window=1000):
+        self.lock = threading.Lock()
+        self.pending = []
+        self.shown = []
+        self.samples = {(kind, bound): collections.deque(maxlen=window)
+                        for kind in ["fire", "move"] for bound in ["min", "max"]}
+        self.file = open(path, "w")
+        self.file.write("seconds,kind,bound,count," +
+                        ",".join("p" + str(p) + "_ms" for p in PERCENTILES) + "\n")
+        self.export_seconds = export_seconds
+        self.start_time = time.perf_counter()
+        self.next_export = self.start_time + export_seconds
+
+    def inputs_applied(self, applied, game_state):
+        # Called before the game is stepped with the newly applied input.
+        with self.lock:
+            for timestamp, action, pressed, since in applied:
+                if not pressed:
+                    self.pending = [entry for entry in self.pending if entry[2] != action]
+                elif game_state.mode != "playing":
+                    continue
+                elif action == "fire":
+                    self.pending.append((timestamp, since, action, "fire",
+                                         game_state.shots_fired))
+                elif action in MOVEMENT_ACTIONS:
+                    self.pending.append((timestamp, since, action, "move",
+                                         game_state.player.rect.topleft))
+
+    def state_updated(self, game_state):
+        now = time.perf_counter()
+        with self.lock:
+            still_pending = []
+            for timestamp, since, action, kind, before in self.pending:
+                if kind == "fire":
+                    after = game_state.shots_fired
+                else:
+                    after = game_state.player.rect.topleft
+                if after != before:
+                    self.shown.append((timestamp, since, kind))
+                elif now - timestamp < GIVE_UP_SECONDS:
+                    still_pending.append((timestamp, since, action, kind, before))
+            self.pending = still_pending
+
+    def frame_presented(self):
+        now = time.perf_counter()
+        with self.lock:
+            for timestamp, since, kind in self.shown:
+                self.samples[kind, "min"].append(now - timestamp)
+                self.samples[kind, "max"].append(now - since)
+            self.shown = []
+        if now >= self.next_export:
+            self.export(now)
+            self.next_export = now + self.export_seconds
+
+    def percentiles(self, kind, bound):
+        with self.lock:
+            values = sorted(self.samples[kind, bound])
+        if not values:
+            return None
+        return [percentile(values, p) for p in PERCENTILES]
+
+    def export(self, now):
+        for kind, bound in self.samples:
+            values = self.percentiles(kind, bound)
+            if values is None:
+                continue
+            self.file.write("%.1f,%s,%s,%d,%s\n" % (
+                now - self.start_time, kind, bound, len(self.samples[kind, bound]),
+                ",".join("%.2f" % (value * 1000) for value in values)))
+        self.file.flush()
+
+    def close(self):
+        self.export(time.perf_counter())
+        self.file.close()
@@ -0,0 +1,149 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Prints how much memory the game's entities take. Run with
+# "python memoryreport.py [ticks]". It first measures the bytes per entity
+# of each type by making a thousand of them, and then plays a scripted
+# headless session, taking tracemalloc snapshots along the way, and prints
+# the live entities at each snapshot and the lines whose allocations grew.
+
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import final
+
+SAMPLE_COUNT = 1000
+ENTITY_TYPES = ["Player", "PlayerShot", "AlienShot", "Alien", "Star", "Explosion"]
+GAME_FILES = ["final.py", "projectiles.py", "particles.py", "timers.py"]
+
+
+class ScriptedInput:
+    # Holds fire in bursts and sweeps up and down, so there is always
+    # something being shot.
+    def __init__(self):
+        self.stop = False
+        self.left = False
+        self.right = False
+        self.pause = False
+        self.applied = []
+
+    def set_tick(self, tick):
+        self.fire = tick % 20 < 10
+        self.up = tick % 240 < 120
+        self.down = not self.up
+
+
+def sample_factories(graphics, game_area):
+    star_random = random.Random(1)
+    return {
+        "Player": lambda i: final.Player(graphics.player.get_rect(), game_area),
+        "PlayerShot": lambda i: final.PlayerShot(graphics.player_shot.get_rect(center=(i, 100))),
+        "AlienShot": lambda i: final.AlienShot(graphics.alien_shot.get_rect(center=(i, 100)),
+                                               -400, random.uniform(-1, 1) + 100),
+        "Alien": lambda i: final.make_alien(graphics, game_area, i, 0),
+        "Star": lambda i: final.random_star_for_x(i % game_area.width, game_area.height,
+                                                 star_random),
+        "Explosion": lambda i: final.Explosion((i, 100), 60, (255, 200, 0)),
+    }
+
+
+def bytes_per_entity(factory):
+    gc.collect()
+    entities = [None] * SAMPLE_COUNT
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(SAMPLE_COUNT):
+        entities[i] = factory(i)
+    after = tracemalloc.get_traced_memory()[0]
+    return (after - before) / SAMPLE_COUNT
+
+
+def live_entities(game_state):
+    return {
+        "Player": [game_state.player],
+        "PlayerShot": game_state.player_shots,
+        "AlienShot": game_state.alien_shots,
+        "Alien": game_state.aliens,
+        "Star": game_state.stars,
+        "Explosion": game_state.explosions,
+    }
+
+
+def print_live_entities(tick, game_state, sizes):
+    total = 0
+    parts = []
+    for name, entities in live_entities(game_state).items():
+        total = total + len(entities) * sizes[name]
+        parts.append("%s %d" % (name, len(entities)))
+    print("Tick %6d: %s, about %.1f KiB" % (tick, ", ".join(parts), total / 1024))
+
+
+def main(ticks):
+    pygame.init()
+    pygame.display.set_mode((800, 600))
+    graphics = final.Graphics()
+    game_area = pygame.Rect(0, 0, 800, 560)
+    tracemalloc.start()
+
+    print("Bytes per entity:")
+    sizes = {}
+    for name, factory in sample_factories(graphics, game_area).items():
+        sizes[name] = bytes_per_entity(factory)
+        print("  %-12s %8.0f" % (name, sizes[name]))
+
+    print("Scripted session of %d ticks:" % ticks)
+    random.seed(1)
+    game_state = final.GameState(graphics, game_area)
+    player_input = ScriptedInput()
+    filters = [tracemalloc.Filter(True, "*" + name) for name in GAME_FILES]
+    gc.collect()
+    first = tracemalloc.take_snapshot().filter_traces(filters)
+    for tick in range(ticks + 1):
+        if tick % (ticks // 4 or 1) == 0:
+            print_live_entities(tick, game_state, sizes)
+        player_input.set_tick(tick)
+        game_state = final.step_game(game_state, player_input, graphics, 1 / 60)
+
+    gc.collect()
+    last = tracemalloc.take_snapshot().filter_traces(filters)
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in ENTITY_TYPES:
+            counts[name] = counts.get(name, 0) + 1
+    print("Entity objects alive at the end:",
+          ", ".join("%s %d" % (name, counts.get(name, 0)) for name in ENTITY_TYPES))
+    print("Lines whose allocations grew the most during the session:")
+    for difference in last.compare_to(first, "lineno")[:10]:
+        print("  " + str(difference))
+    tracemalloc.stop()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3600)
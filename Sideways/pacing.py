@@ -0,0 +1,165 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Keeps frames on a fixed schedule of deadlines. Sleeping is only accurate
+# to a millisecond or worse, so the pacer sleeps until shortly before the
+# deadline and then spins on perf_counter for the rest. Because the
+# deadlines are fixed, a late frame is made up for by a shorter wait before
+# the next one instead of pushing every later frame back.
+
+import collections
+import time
+
+SPIN_SECONDS = 0.002
+MAX_LAG_SECONDS = 0.25
+BUCKET_SECONDS = 0.0005
+BUCKET_COUNT = 16
+SLOW_FRAME_FRACTION = 1.5
+
+
+class FramePacer:
+    def __init__(self, frames_per_second, sleep=True, spin_seconds=SPIN_SECONDS,
+                 collector=None):
+        # With a gccontrol.Collector the pacer also counts the slow frames
+        # that had a garbage collection in them.
+        self.collector = collector
+        self.collector_seconds = 0.0
+        self.slow_frames = 0
+        self.slow_frames_collected = 0
+        self.period = 1.0 / frames_per_second
+        self.sleep = sleep
+        self.spin_seconds = spin_seconds
+        self.deadline = time.perf_counter() + self.period
+        self.previous = None
+        self.intervals = collections.deque(maxlen=10000)
+        self.histogram = [0] * (2 * BUCKET_COUNT + 1)
+
+    def wait(self):
+        # With sleep turned off something else, like a vsynced flip, is
+        # expected to hold the frame back, and the pacer only keeps count.
+        if self.sleep:
+            remaining = self.deadline - time.perf_counter()
+            if remaining > self.spin_seconds:
+                time.sleep(remaining - self.spin_seconds)
+            while time.perf_counter() < self.deadline:
+                # sleep(0) lets other threads have the GIL while spinning.
+                time.sleep(0)
+
+        now = time.perf_counter()
+        collected = False
+        if self.collector:
+            collected = self.collector.seconds != self.collector_seconds
+            self.collector_seconds = self.collector.seconds
+        if self.previous is not None:
+            self.record(now - self.previous, collected)
+        self.previous = now
+
+        self.deadline = self.deadline + self.period
+        if now - self.deadline > MAX_LAG_SECONDS:
+            # Too far behind to catch up, so start over from now instead of
+            # running a burst of short frames.
+            self.deadline = now + self.period
+
+    def set_frames_per_second(self, frames_per_second):
+        period = 1.0 / frames_per_second
+        if period != self.period:
+            self.deadline = self.deadline - self.period + period
+            self.period = period
+
+    def resume(self):
+        # Starts over after a time in which wait was not called, without
+        # counting that time as a frame.
+        self.previous = None
+        self.deadline = time.perf_counter() + self.period
+
+    def spare_seconds(self):
+        return self.deadline - time.perf_counter()
+
+    def record(self, interval, collected=False):
+        if interval > self.period * SLOW_FRAME_FRACTION:
+            self.slow_frames = self.slow_frames + 1
+            if collected:
+                self.slow_frames_collected = self.slow_frames_collected + 1
+        self.intervals.append(interval)
+        bucket = round((interval - self.period) / BUCKET_SECONDS)
+        bucket = max(-BUCKET_COUNT, min(BUCKET_COUNT, bucket))
+        self.histogram[bucket + BUCKET_COUNT] = self.histogram[bucket + BUCKET_COUNT] + 1
+
+    def report(self, name):
+        if not self.intervals:
+            return name + ": no frames"
+        intervals = sorted(self.intervals)
+        mean = sum(intervals) / len(intervals)
+        jitter = (sum((interval - mean) ** 2 for interval in intervals) / len(intervals)) ** 0.5
+        lines = [name + ": target %.2f ms, mean %.2f ms, jitter %.3f ms, 99th percentile %.2f ms" % (
+            self.period * 1000, mean * 1000, jitter * 1000,
+            intervals[len(intervals) * 99 // 100] * 1000)]
+        most = max(self.histogram)
+        for index, count in enumerate(self.histogram):
+            if count == 0:
+                continue
+            offset = (index - BUCKET_COUNT) * BUCKET_SECONDS * 1000
+            label = "%+5.1f ms" % offset
+            if index == 0:
+                label = "<=" + label
+            elif index == len(self.histogram) - 1:
+                label = ">=" + label
+            bar = "#" * max(1, count * 40 // most)
+            lines.append("  %10s %-40s %d" % (label, bar, count))
+        if self.collector:
+            lines.append("  Slow frames: %d, with a garbage collection in them: %d" % (
+                self.slow_frames, self.slow_frames_collected))
+        return "\n".join(lines)
+
+
+class IdleMeter:
+    # Adds up the real and CPU time spent in idle frames. frame_started is
+    # called at the start of every frame with whether the last one was idle.
+    # other_cpu_seconds, if given, returns the CPU time used so far by
+    # another process that is part of the game, which is counted as well.
+    def __init__(self, other_cpu_seconds=None):
+        self.other_cpu_seconds = other_cpu_seconds
+        self.idle_seconds = 0.0
+        self.idle_cpu_seconds = 0.0
+        self.last = None
+
+    def cpu_seconds(self):
+        if self.other_cpu_seconds:
+            return time.process_time() + self.other_cpu_seconds()
+        return time.process_time()
+
+    def frame_started(self, last_was_idle):
+        now = (time.perf_counter(), self.cpu_seconds())
+        if self.last is not None and last_was_idle:
+            self.idle_seconds = self.idle_seconds + now[0] - self.last[0]
+            self.idle_cpu_seconds = self.idle_cpu_seconds + now[1] - self.last[1]
+        self.last = now
+
+    def report(self):
+        if self.idle_seconds == 0:
+            return "Idle: no idle frames"
+        processes = "this process"
+        if self.other_cpu_seconds:
+            processes = "both processes"
+        return "Idle: %.1f s, %.2f CPU seconds per idle minute in %s" % (
+            self.idle_seconds, self.idle_cpu_seconds / self.idle_seconds * 60, processes)
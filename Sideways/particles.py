@@ -0,0 +1,155 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Particles are kept in NumPy arrays, one array per property, so moving and
+# removing them is done for all of them at once instead of one Python object
+# at a time. The live particles are always the first `count` entries.
+#
+# NumPy is optional. Without it make_particle_system returns None and the
+# game has no particles.
+
+import math
+import pygame
+
+try:
+    import numpy
+    import pygame.surfarray
+except ImportError:
+    numpy = None
+
+DRAG_PER_SECOND = 1.5
+
+
+def make_particle_system(capacity):
+    if numpy is None or capacity <= 0:
+        return None
+    return ParticleSystem(capacity)
+
+
+class ParticleFrame:
+    # The positions and colours of the live particles, ready to be drawn.
+    def __init__(self, x, y, color, palette):
+        self.x = x
+        self.y = y
+        self.color = color
+        self.palette = palette
+
+
+class ParticleSystem:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.x = numpy.zeros(capacity, numpy.float32)
+        self.y = numpy.zeros(capacity, numpy.float32)
+        self.speed_x = numpy.zeros(capacity, numpy.float32)
+        self.speed_y = numpy.zeros(capacity, numpy.float32)
+        self.age = numpy.zeros(capacity, numpy.float32)
+        self.lifetime = numpy.zeros(capacity, numpy.float32)
+        self.color = numpy.zeros(capacity, numpy.uint8)
+        self.palette = []
+        self.random = numpy.random.default_rng()
+
+    def arrays(self):
+        return [self.x, self.y, self.speed_x, self.speed_y,
+                self.age, self.lifetime, self.color]
+
+    def color_index(self, color):
+        if color not in self.palette:
+            self.palette.append(color)
+        return self.palette.index(color)
+
+    def emit(self, center, count, speed, colors, lifetime):
+        # When the system is full the newest explosion just gets fewer
+        # particles.
+        count = min(count, self.capacity - self.count)
+        if count <= 0:
+            return
+        new = slice(self.count, self.count + count)
+        angle = self.random.uniform(0, 2 * math.pi, count)
+        velocity = speed * self.random.uniform(0.2, 1.0, count)
+        self.x[new] = center[0]
+        self.y[new] = center[1]
+        self.speed_x[new] = numpy.cos(angle) * velocity
+        self.speed_y[new] = numpy.sin(angle) * velocity
+        self.age[new] = 0
+        self.lifetime[new] = lifetime * self.random.uniform(0.5, 1.0, count)
+        indexes = [self.color_index(color) for color in colors]
+        self.color[new] = self.random.choice(indexes, count)
+        self.count = self.count + count
+
+    def update(self, seconds):
+        count = self.count
+        if count == 0:
+            return
+        drag = max(0.0, 1.0 - DRAG_PER_SECOND * seconds)
+        self.speed_x[:count] *= drag
+        self.speed_y[:count] *= drag
+        self.x[:count] += self.speed_x[:count] * seconds
+        self.y[:count] += self.speed_y[:count] * seconds
+        self.age[:count] += seconds
+
+        alive = self.age[:count] < self.lifetime[:count]
+        if alive.all():
+            return
+        live = numpy.flatnonzero(alive)
+        for array in self.arrays():
+            array[:len(live)] = array[:count][live]
+        self.count = len(live)
+
+    def frame(self, copy=False):
+        count = self.count
+        frame = ParticleFrame(self.x[:count], self.y[:count], self.color[:count],
+                              list(self.palette))
+        if copy:
+            frame.x = frame.x.copy()
+            frame.y = frame.y.copy()
+            frame.color = frame.color.copy()
+        return frame
+
+    def __getstate__(self):
+        # Particles are only for show, so replays do not store them.
+        return {"capacity": self.capacity}
+
+    def __setstate__(self, state):
+        self.__init__(state["capacity"])
+
+
+def pixel_positions(frame, scale, area):
+    # Returns the pixel coordinates, inside area, of the particles that are
+    # in it, together with their palette indexes.
+    xs = (frame.x * scale).astype(numpy.int32) + area.x
+    ys = (frame.y * scale).astype(numpy.int32) + area.y
+    inside = (xs >= area.left) & (xs < area.right) & (ys >= area.top) & (ys < area.bottom)
+    return xs[inside], ys[inside], frame.color[inside]
+
+
+def paint_pixels(surface, frame, scale, area):
+    if len(frame.x) == 0:
+        return
+    xs, ys, colors = pixel_positions(frame, scale, area)
+    pixels = pygame.surfarray.pixels2d(surface)
+    # map_rgb can give a negative number for surfaces with alpha, so the
+    # values are wrapped around to the pixel type here.
+    mapped = numpy.array([surface.map_rgb(color) for color in frame.palette], numpy.int64)
+    pixels[xs, ys] = mapped.astype(pixels.dtype)[colors]
+    del pixels
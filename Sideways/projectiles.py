@@ -0,0 +1,195 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Alien shots for the waves that fire patterns. All the shots live in NumPy
+# arrays, the live ones packed at the front, so moving them, removing the
+# ones that have left the game area and testing them against the player are
+# each one operation over the arrays.
+#
+# NumPy is optional. Without it make_projectile_system returns None and the
+# aliens keep firing single shots.
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def make_projectile_system(capacity, shot_size):
+    if numpy is None or capacity <= 0:
+        return None
+    return ProjectileSystem(capacity, shot_size)
+
+
+class ProjectileSystem:
+    def __init__(self, capacity, shot_size):
+        self.capacity = capacity
+        self.width, self.height = shot_size
+        self.count = 0
+        self.x = numpy.zeros(capacity, numpy.float32)
+        self.y = numpy.zeros(capacity, numpy.float32)
+        self.speed_x = numpy.zeros(capacity, numpy.float32)
+        self.speed_y = numpy.zeros(capacity, numpy.float32)
+
+    def clear(self):
+        self.count = 0
+
+    def spawn(self, center, speed_x, speed_y):
+        count = min(len(speed_x), self.capacity - self.count)
+        if count <= 0:
+            return
+        new = slice(self.count, self.count + count)
+        self.x[new] = center[0] - self.width / 2
+        self.y[new] = center[1] - self.height / 2
+        self.speed_x[new] = speed_x[:count]
+        self.speed_y[new] = speed_y[:count]
+        self.count = self.count + count
+
+    def move(self, seconds):
+        count = self.count
+        self.x[:count] += self.speed_x[:count] * seconds
+        self.y[:count] += self.speed_y[:count] * seconds
+
+    def cull(self, area):
+        # Drops the shots that have left area. The game does this after the
+        # hit test, so a shot that hits on its way out still counts.
+        count = self.count
+        if count == 0:
+            return
+        x = self.x[:count]
+        y = self.y[:count]
+        inside = ((x < area.right) & (x + self.width > area.left) &
+                  (y < area.bottom) & (y + self.height > area.top))
+        if inside.all():
+            return
+        live = numpy.flatnonzero(inside)
+        for array in [self.x, self.y, self.speed_x, self.speed_y]:
+            array[:len(live)] = array[:count][live]
+        self.count = len(live)
+
+    def hits(self, rect, moved, seconds):
+        # The indexes of the shots that overlapped rect at some point during
+        # the last update, which moved them for seconds while rect moved by
+        # moved. Seen from rect the shots move in straight lines, so each is
+        # a line test against rect grown by the size of a shot.
+        # Only the shots whose paths' bounding boxes touch rect are tested.
+        count = self.count
+        x = self.x[:count]
+        y = self.y[:count]
+        move_x = self.speed_x[:count] * seconds - moved[0]
+        move_y = self.speed_y[:count] * seconds - moved[1]
+        start_x = x - move_x
+        start_y = y - move_y
+        near = numpy.flatnonzero((numpy.minimum(start_x, x) < rect.right) &
+                                 (numpy.maximum(start_x, x) + self.width > rect.left) &
+                                 (numpy.minimum(start_y, y) < rect.bottom) &
+                                 (numpy.maximum(start_y, y) + self.height > rect.top))
+        enter_x, leave_x = sweep_axis(start_x[near], move_x[near], self.width,
+                                      rect.left, rect.right)
+        enter_y, leave_y = sweep_axis(start_y[near], move_y[near], self.height,
+                                      rect.top, rect.bottom)
+        enter = numpy.maximum(numpy.maximum(enter_x, enter_y), 0)
+        leave = numpy.minimum(numpy.minimum(leave_x, leave_y), 1)
+        return near[enter < leave]
+
+    def speeds(self):
+        return self.speed_x[:self.count], self.speed_y[:self.count]
+
+    def positions(self, copy=False):
+        if copy:
+            return self.x[:self.count].copy(), self.y[:self.count].copy()
+        return self.x[:self.count], self.y[:self.count]
+
+    def __getstate__(self):
+        # Replays keep the live shots only, not the whole capacity.
+        state = dict(self.__dict__)
+        for name in ["x", "y", "speed_x", "speed_y"]:
+            state[name] = state[name][:self.count].copy()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name in ["x", "y", "speed_x", "speed_y"]:
+            live = state[name]
+            array = numpy.zeros(self.capacity, numpy.float32)
+            array[:len(live)] = live
+            setattr(self, name, array)
+
+
+def sweep_axis(start, move, size, low, high):
+    # The times at which things starting at start and moving by move overlap
+    # the range from low to high along one axis. Things that do not move
+    # along the axis overlap always or never.
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        time_low = (low - size - start) / move
+        time_high = (high - start) / move
+    still = move == 0
+    inside = (start + size > low) & (start < high)
+    enter = numpy.where(still, numpy.where(inside, -numpy.inf, numpy.inf),
+                        numpy.minimum(time_low, time_high))
+    leave = numpy.where(still, numpy.where(inside, numpy.inf, -numpy.inf),
+                        numpy.maximum(time_low, time_high))
+    return enter, leave
+
+
+class Emitter:
+    # Fires volleys of shots in one pattern. A burst is a number of volleys
+    # a short time apart, and between volleys the pattern turns a little.
+    #   ring    count shots spread evenly all the way around
+    #   spiral  a ring with few shots that turns a lot between volleys
+    #   fan     count shots spread over an angle, aimed at the target
+    def __init__(self, pattern, count, speed, volleys, volley_seconds, turn=0.0, spread=0.0):
+        self.pattern = pattern
+        self.count = count
+        self.speed = speed
+        self.volleys = volleys
+        self.volley_seconds = volley_seconds
+        self.turn = turn
+        self.spread = spread
+        self.angle = 0.0
+        self.volleys_left = 0
+
+    def fire(self, center, target):
+        if self.volleys_left == 0:
+            self.volleys_left = self.volleys
+        self.volleys_left = self.volleys_left - 1
+
+        if self.pattern == "fan":
+            aim = math.atan2(target[1] - center[1], target[0] - center[0])
+            angles = aim + numpy.linspace(-self.spread / 2, self.spread / 2, self.count)
+        else:
+            angles = self.angle + numpy.arange(self.count) * (2 * math.pi / self.count)
+            self.angle = self.angle + self.turn
+        return numpy.cos(angles) * self.speed, numpy.sin(angles) * self.speed
+
+    def in_burst(self):
+        return self.volleys_left > 0
+
+
+def blit_positions(xs, ys, scale, offset_y):
+    # The positions as a list of [x, y] pixel lists, which is the quickest
+    # thing to hand to Surface.blits for this many sprites.
+    positions = numpy.column_stack((xs * scale, (ys + offset_y) * scale))
+    return positions.astype(numpy.int32).tolist()
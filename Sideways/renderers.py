@@ -0,0 +1,261 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# The painting code in final.py draws through one of these. Both use the
+# game's 800x600 coordinates, and inside the game area the origin is the
+# top left corner of the game area.
+#
+# SurfaceRenderer blits onto the display surface, or onto a smaller canvas
+# that is stretched to the window when Graphics has a RENDER_SCALE below 1.
+# BufferedSurfaceRenderer blits onto off-screen surfaces instead, so that a
+# thread other than the window's can do the drawing.
+#
+# TextureRenderer uses SDL's renderer API. The sprites are uploaded as
+# textures once, and stars and explosions are drawn by stretching a white
+# circle texture and tinting it. SDL picks a GPU renderer when there is one
+# and falls back to its software renderer when there is not.
+
+import pygame
+import itertools
+import threading
+import particles
+import projectiles
+
+CIRCLE_TEXTURE_RADIUS = 64
+RING_WIDTH_FRACTION = 1 / 16
+BATCH_COLORKEY = (255, 0, 255)
+# Posted when a BufferedSurfaceRenderer has a frame ready to be shown, so
+# that the window's thread can sleep in pygame.event.wait.
+FRAME_READY = pygame.event.custom_type()
+
+
+class SurfaceRenderer:
+    def __init__(self, window, graphics):
+        self.window = window
+        self.graphics = graphics
+        self.scale = graphics.scale
+        self.width, self.height = window.get_size()
+        self.surface = window
+        if graphics.canvas is not None:
+            self.surface = graphics.canvas
+        self.offset_y = 0
+        self.batch_images = {}
+        # A capture.FrameCapture that is shown every frame, if recording.
+        self.capture = None
+
+    def clear(self):
+        self.surface.fill((0, 0, 0))
+
+    def enter_game_area(self, game_area):
+        scale = self.scale
+        self.offset_y = self.height - game_area.height
+        self.surface.set_clip(pygame.Rect(0, self.offset_y * scale,
+                                          game_area.width * scale,
+                                          game_area.height * scale))
+
+    def leave_game_area(self):
+        self.offset_y = 0
+        self.surface.set_clip(None)
+
+    def sprite(self, name, x, y):
+        scale = self.scale
+        self.surface.blit(self.graphics.scaled[name], (x * scale, (y + self.offset_y) * scale))
+
+    def sprites(self, name, xs, ys):
+        # Many copies of one sprite, with the positions in two arrays. They
+        # are blitted from a run-length encoded colorkey copy, which SDL
+        # blits about twice as fast as per-pixel alpha. The sprites drawn
+        # this way have no half transparent pixels, so they look the same.
+        scale = self.scale
+        image = self.batch_images.get(name)
+        if image is None:
+            image = make_batch_image(self.graphics.scaled[name])
+            self.batch_images[name] = image
+        positions = projectiles.blit_positions(xs, ys, scale, self.offset_y)
+        self.surface.blits(zip(itertools.repeat(image), positions), False)
+
+    def circle(self, color, x, y, radius, width=0):
+        scale = self.scale
+        pygame.draw.circle(self.surface, color, (x * scale, (y + self.offset_y) * scale),
+                           radius * scale, width)
+
+    def particles(self, frame):
+        particles.paint_pixels(self.surface, frame, self.scale, self.surface.get_clip())
+
+    def text(self, text, color, **position):
+        scale = self.scale
+        image = self.graphics.text_image(text, color)
+        if image is None:
+            return
+        rect = pygame.Rect(0, 0, image.get_width() / scale, image.get_height() / scale)
+        for name, value in position.items():
+            setattr(rect, name, value)
+        self.surface.blit(image, (rect.x * scale, rect.y * scale))
+
+    def present(self):
+        if self.surface is not self.window:
+            pygame.transform.scale(self.surface, self.window.get_size(), self.window)
+        pygame.display.flip()
+        if self.capture:
+            self.capture.frame(self.window)
+
+
+class BufferedSurfaceRenderer(SurfaceRenderer):
+    # Draws into one of three off-screen surfaces. present hands the
+    # finished one over, replacing an older one that was never shown, and
+    # show copies it to the window and flips. Only show has to run on the
+    # window's thread. Of the three surfaces one is being drawn, one waits
+    # to be shown and one is on the window.
+    def __init__(self, window, graphics):
+        super().__init__(window, graphics)
+        self.lock = threading.Lock()
+        self.free = [self.surface.copy() for i in range(3)]
+        self.surface = self.free.pop()
+        self.ready = None
+        self.showing = None
+
+    def present(self):
+        with self.lock:
+            if self.ready is not None:
+                self.free.append(self.ready)
+            self.ready = self.surface
+            self.surface = self.free.pop()
+        pygame.event.post(pygame.event.Event(FRAME_READY))
+
+    def show(self):
+        # Returns whether there was a new frame to show.
+        with self.lock:
+            frame = self.ready
+            if frame is None:
+                return False
+            self.ready = None
+            if self.showing is not None:
+                self.free.append(self.showing)
+            self.showing = frame
+        if frame.get_size() == self.window.get_size():
+            self.window.blit(frame, (0, 0))
+        else:
+            pygame.transform.scale(frame, self.window.get_size(), self.window)
+        pygame.display.flip()
+        if self.capture:
+            self.capture.frame(self.window)
+        return True
+
+
+def make_batch_image(image):
+    batch_image = pygame.Surface(image.get_size())
+    batch_image.fill(BATCH_COLORKEY)
+    batch_image.blit(image, (0, 0))
+    batch_image.set_colorkey(BATCH_COLORKEY, pygame.RLEACCEL)
+    return batch_image
+
+
+def make_circle_image(width):
+    size = 2 * CIRCLE_TEXTURE_RADIUS
+    image = pygame.Surface((size, size), pygame.SRCALPHA)
+    pygame.draw.circle(image, (255, 255, 255), (CIRCLE_TEXTURE_RADIUS, CIRCLE_TEXTURE_RADIUS),
+                       CIRCLE_TEXTURE_RADIUS, width)
+    return image
+
+
+class TextureRenderer:
+    def __init__(self, window, graphics, size, vsync=False):
+        from pygame._sdl2 import video
+
+        self.video = video
+        self.graphics = graphics
+        self.width, self.height = size
+        self.renderer = video.Renderer(window, vsync=vsync)
+        self.renderer.logical_size = size
+        # The sprite textures are made the first time they are drawn, since
+        # the images may still be loading when the renderer is made.
+        self.textures = {}
+        ring_width = round(CIRCLE_TEXTURE_RADIUS * RING_WIDTH_FRACTION)
+        self.circle_texture = video.Texture.from_surface(self.renderer, make_circle_image(0))
+        self.ring_texture = video.Texture.from_surface(self.renderer, make_circle_image(ring_width))
+        self.text_textures = {}
+        self.particle_surface = None
+        self.particle_texture = None
+
+    def clear(self):
+        self.renderer.draw_color = (0, 0, 0, 255)
+        self.renderer.clear()
+
+    def enter_game_area(self, game_area):
+        offset_y = self.height - game_area.height
+        self.renderer.set_viewport(pygame.Rect(0, offset_y, game_area.width, game_area.height))
+
+    def leave_game_area(self):
+        self.renderer.set_viewport(None)
+
+    def texture(self, name):
+        texture = self.textures.get(name)
+        if texture is None:
+            texture = self.video.Texture.from_surface(self.renderer, self.graphics.scaled[name])
+            self.textures[name] = texture
+        return texture
+
+    def sprite(self, name, x, y):
+        self.texture(name).draw(dstrect=(x, y))
+
+    def sprites(self, name, xs, ys):
+        draw = self.texture(name).draw
+        for position in projectiles.blit_positions(xs, ys, 1, 0):
+            draw(dstrect=position)
+
+    def circle(self, color, x, y, radius, width=0):
+        if radius <= 0:
+            return
+        texture = self.circle_texture
+        if width:
+            texture = self.ring_texture
+        texture.color = color
+        texture.draw(dstrect=(x - radius, y - radius, 2 * radius, 2 * radius))
+
+    def particles(self, frame):
+        # The particles are drawn into a transparent surface that is sent to
+        # a streaming texture once per frame.
+        width, height = self.renderer.get_viewport().size
+        if self.particle_surface is None or self.particle_surface.get_size() != (width, height):
+            self.particle_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+            self.particle_texture = self.video.Texture(self.renderer, (width, height),
+                                                       streaming=True)
+            self.particle_texture.blend_mode = pygame.BLENDMODE_BLEND
+        self.particle_surface.fill((0, 0, 0, 0))
+        particles.paint_pixels(self.particle_surface, frame, 1, self.particle_surface.get_rect())
+        self.particle_texture.update(self.particle_surface)
+        self.particle_texture.draw(dstrect=(0, 0))
+
+    def text(self, text, color, **position):
+        key = (text, color)
+        texture = self.text_textures.get(key)
+        if texture is None:
+            image = self.graphics.text_image(text, color)
+            if image is None:
+                return
+            texture = self.video.Texture.from_surface(self.renderer, image)
+            self.text_textures[key] = texture
+        texture.draw(dstrect=texture.get_rect(**position))
+
+    def present(self):
+        self.renderer.present()
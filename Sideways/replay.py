@@ -0,0 +1,267 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Replay files store the input of every tick together with a full copy of
+# the game state every KEYFRAME_INTERVAL ticks. An index at the end of the
+# file lists where the keyframes are, so seeking only has to simulate the
+# ticks since the nearest keyframe instead of the whole session.
+#
+# File layout:
+#   header                      magic, version, keyframe interval
+#   keyframe / input records    interleaved, one input record per tick
+#   index                       one entry per keyframe
+#   footer                      where the index starts, magic
+
+import bisect
+import io
+import mmap
+import pickle
+import random
+import struct
+
+MAGIC = b"SWRP"
+INDEX_MAGIC = b"SWIX"
+VERSION = 1
+KEYFRAME_INTERVAL = 600
+
+HEADER = struct.Struct("<4sHI")
+INPUT_RECORD = struct.Struct("<cdB")
+KEYFRAME_RECORD = struct.Struct("<cIdI")
+INDEX_ENTRY = struct.Struct("<IdQ")
+FOOTER = struct.Struct("<QII4s")
+
+BUTTONS = ["left", "right", "up", "down", "fire", "pause"]
+
+
+def pack_buttons(player_input):
+    buttons = 0
+    for bit, name in enumerate(BUTTONS):
+        if getattr(player_input, name):
+            buttons = buttons | (1 << bit)
+    return buttons
+
+
+class ReplayInput:
+    def __init__(self, buttons):
+        self.stop = False
+        for bit, name in enumerate(BUTTONS):
+            setattr(self, name, bool(buttons & (1 << bit)))
+
+
+class StateUnpickler(pickle.Unpickler):
+    # The game is normally started with "python final.py", which makes the
+    # recorded classes live in __main__ rather than in the final module.
+    def find_class(self, module, name):
+        if module == "__main__":
+            module = "final"
+        return super().find_class(module, name)
+
+
+class ReplayWriter:
+    def __init__(self, path, keyframe_interval=KEYFRAME_INTERVAL):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, keyframe_interval))
+        self.keyframe_interval = keyframe_interval
+        self.tick = 0
+        self.seconds = 0.0
+        self.index = []
+
+    def record(self, game_state, player_input, seconds):
+        if self.tick % self.keyframe_interval == 0:
+            self.write_keyframe(game_state)
+        self.file.write(INPUT_RECORD.pack(b"I", seconds,
+                                          pack_buttons(player_input)))
+        self.tick = self.tick + 1
+        self.seconds = self.seconds + seconds
+
+    def write_keyframe(self, game_state):
+        data = pickle.dumps((game_state, random.getstate()),
+                            pickle.HIGHEST_PROTOCOL)
+        self.index.append((self.tick, self.seconds, self.file.tell()))
+        self.file.write(KEYFRAME_RECORD.pack(b"K", self.tick, self.seconds,
+                                             len(data)))
+        self.file.write(data)
+
+    def close(self):
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), self.tick,
+                                    INDEX_MAGIC))
+        self.file.close()
+
+
+class ReplayReader:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, keyframe_interval = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(path + " is not a replay file")
+        if version != VERSION:
+            raise ValueError("Unsupported replay version " + str(version))
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_ticks = []
+        self.keyframe_seconds = []
+        self.keyframe_offsets = []
+        if not self.read_index():
+            self.scan_for_keyframes()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def read_index(self):
+        if len(self.data) < HEADER.size + FOOTER.size:
+            return False
+        footer_offset = len(self.data) - FOOTER.size
+        index_offset, count, tick_count, magic = FOOTER.unpack_from(self.data, footer_offset)
+        if magic != INDEX_MAGIC:
+            return False
+        for i in range(count):
+            entry_offset = index_offset + i * INDEX_ENTRY.size
+            tick, seconds, offset = INDEX_ENTRY.unpack_from(self.data, entry_offset)
+            self.keyframe_ticks.append(tick)
+            self.keyframe_seconds.append(seconds)
+            self.keyframe_offsets.append(offset)
+        self.tick_count = tick_count
+        self.records_end = index_offset
+        return True
+
+    def scan_for_keyframes(self):
+        # A recording that was never closed (a crash, a killed soak test)
+        # has no index, so rebuild it by walking the records once.
+        self.tick_count = 0
+        self.records_end = len(self.data)
+        for offset, kind, record in self.records(HEADER.size):
+            if kind == b"K":
+                tick, seconds, length = record
+                self.keyframe_ticks.append(tick)
+                self.keyframe_seconds.append(seconds)
+                self.keyframe_offsets.append(offset)
+            else:
+                self.tick_count = self.tick_count + 1
+
+    def records(self, offset):
+        while offset + 1 <= self.records_end:
+            kind = self.data[offset:offset + 1]
+            if kind == b"I":
+                if offset + INPUT_RECORD.size > self.records_end:
+                    return
+                _, seconds, buttons = INPUT_RECORD.unpack_from(self.data, offset)
+                yield offset, kind, (seconds, buttons)
+                offset = offset + INPUT_RECORD.size
+            elif kind == b"K":
+                if offset + KEYFRAME_RECORD.size > self.records_end:
+                    return
+                _, tick, seconds, length = KEYFRAME_RECORD.unpack_from(self.data, offset)
+                if offset + KEYFRAME_RECORD.size + length > self.records_end:
+                    return
+                yield offset, kind, (tick, seconds, length)
+                offset = offset + KEYFRAME_RECORD.size + length
+            else:
+                return
+
+    def duration(self):
+        seconds = self.keyframe_seconds[-1] if self.keyframe_seconds else 0.0
+        last_offset = self.keyframe_offsets[-1] if self.keyframe_offsets else HEADER.size
+        for offset, kind, record in self.records(last_offset):
+            if kind == b"I":
+                seconds = seconds + record[0]
+        return seconds
+
+    def load_keyframe(self, index, graphics):
+        offset = self.keyframe_offsets[index]
+        _, tick, seconds, length = KEYFRAME_RECORD.unpack_from(self.data, offset)
+        start = offset + KEYFRAME_RECORD.size
+        data = io.BytesIO(self.data[start:start + length])
+        game_state, random_state = StateUnpickler(data).load()
+        game_state.graphics = graphics
+        random.setstate(random_state)
+        return game_state
+
+    def seek(self, tick, graphics, step):
+        index = bisect.bisect_right(self.keyframe_ticks, tick) - 1
+        return self.seek_from_keyframe(index, graphics, step,
+                                       lambda at_tick, at_seconds: at_tick >= tick)
+
+    def seek_seconds(self, seconds, graphics, step):
+        index = bisect.bisect_right(self.keyframe_seconds, seconds) - 1
+        return self.seek_from_keyframe(index, graphics, step,
+                                       lambda at_tick, at_seconds: at_seconds >= seconds)
+
+    def seek_from_keyframe(self, index, graphics, step, arrived):
+        # Returns the game state at the target together with the offset of
+        # the next record, so playback can continue from there.
+        index = max(0, index)
+        game_state = self.load_keyframe(index, graphics)
+        tick = self.keyframe_ticks[index]
+        seconds = self.keyframe_seconds[index]
+        offset = self.keyframe_offsets[index]
+        for offset, kind, record in self.records(offset):
+            if kind == b"K":
+                continue
+            if arrived(tick, seconds):
+                return game_state, offset
+            elapsed_seconds, buttons = record
+            game_state = step(game_state, ReplayInput(buttons), graphics, elapsed_seconds)
+            tick = tick + 1
+            seconds = seconds + elapsed_seconds
+        return game_state, self.records_end
+
+    def inputs(self, offset):
+        for offset, kind, record in self.records(offset):
+            if kind == b"I":
+                elapsed_seconds, buttons = record
+                yield elapsed_seconds, ReplayInput(buttons)
+
+
+def play(path, start_seconds):
+    import pygame
+    import time
+    import final
+
+    pygame.init()
+    screen, graphics = final.open_screen((800, 600))
+    reader = ReplayReader(path)
+    game_state, offset = reader.seek_seconds(start_seconds, graphics, final.step_game)
+
+    stopper = final.PlayerInput()
+    for elapsed_seconds, replay_input in reader.inputs(offset):
+        stopper.update()
+        if stopper.stop:
+            break
+        game_state = final.step_game(game_state, replay_input, graphics, elapsed_seconds)
+        final.paint_screen(screen, game_state, graphics)
+        time.sleep(elapsed_seconds)
+    reader.close()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: python replay.py <replay file> [start seconds]")
+        sys.exit(1)
+    start_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    play(sys.argv[1], start_seconds)
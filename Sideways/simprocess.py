@@ -0,0 +1,333 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Runs the simulation in a process of its own, so it does not have to share
+# the GIL with the drawing. The simulation process writes what is to be
+# drawn into NumPy arrays in shared memory, and the drawing process draws
+# straight from them without copying.
+#
+# There are two slots of arrays. The simulation writes each tick into the
+# slot the drawing process is not reading and then marks it as the newest.
+# Each slot has a sequence number that is odd while the slot is being
+# written, so a reader that was overtaken can tell and draw again.
+#
+# The input goes the other way as the (time, action, pressed, since) entries
+# PlayerInput collects, which the simulation applies tick by tick just like
+# the simulation thread does.
+
+import io
+import multiprocessing
+import pickle
+import time
+from multiprocessing import shared_memory
+
+import buttons
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SPRITE_NAMES = ["player", "player_shot", "alien", "alien_shot"]
+MODES = ["waiting", "playing", "gameover", "restart"]
+SPRITE_CAPACITY = 4096
+STAR_CAPACITY = 4096
+EXPLOSION_CAPACITY = 256
+PALETTE_CAPACITY = 256
+
+# The fields of a slot's header and of the control block.
+SEQUENCE, TICK, MODE, LIVES, PAUSED, STARS, EXPLOSIONS, PROJECTILES, \
+    PARTICLES, PALETTE, SPRITES = range(11)
+HEADER_SIZE = SPRITES + len(SPRITE_NAMES)
+# UNFOCUSED is set by the drawing process when the window has no focus, and
+# CPU_MICROSECONDS is the CPU time the simulation process has used since it
+# started ticking.
+NEWEST_SLOT, STOP, QUALITY_LEVEL, UNFOCUSED, CPU_MICROSECONDS = range(5)
+CONTROL_SIZE = 8
+# Writing a slot takes well under a millisecond, so one that stays half
+# written for this long will never be finished.
+WRITE_SECONDS = 1.0
+
+
+def slot_fields(projectile_capacity, particle_capacity):
+    return [("header", numpy.int64, (HEADER_SIZE,)),
+            ("sprites", numpy.float32, (SPRITE_CAPACITY, 2)),
+            ("stars", numpy.float32, (STAR_CAPACITY, 3)),
+            ("star_colors", numpy.uint8, (STAR_CAPACITY, 3)),
+            ("explosions", numpy.float32, (EXPLOSION_CAPACITY, 3)),
+            ("explosion_colors", numpy.uint8, (EXPLOSION_CAPACITY, 3)),
+            ("projectiles", numpy.float32, (2, max(1, projectile_capacity))),
+            ("particles", numpy.float32, (2, max(1, particle_capacity))),
+            ("particle_colors", numpy.uint8, (max(1, particle_capacity),)),
+            ("palette", numpy.uint8, (PALETTE_CAPACITY, 3))]
+
+
+def slot_size(fields):
+    size = 0
+    for name, dtype, shape in fields:
+        size = (size + 7) // 8 * 8 + numpy.dtype(dtype).itemsize * int(numpy.prod(shape))
+    return size
+
+
+class FrameSlot:
+    def __init__(self, buffer, offset, fields):
+        for name, dtype, shape in fields:
+            # Every array starts on an 8 byte boundary.
+            offset = (offset + 7) // 8 * 8
+            array = numpy.ndarray(shape, dtype, buffer, offset)
+            setattr(self, name, array)
+            offset = offset + array.nbytes
+        self.end = offset
+
+    def write(self, game_state, tick):
+        header = self.header
+        header[SEQUENCE] = header[SEQUENCE] + 1
+        header[TICK] = tick
+        header[MODE] = MODES.index(game_state.mode)
+        header[LIVES] = game_state.lives
+        header[PAUSED] = game_state.clock.paused
+
+        sprites = []
+        things = [[game_state.player] if game_state.player.alive else [],
+                  game_state.player_shots, game_state.aliens, game_state.alien_shots]
+        for kind, kind_things in enumerate(things):
+            kind_things = kind_things[:SPRITE_CAPACITY - len(sprites)]
+            header[SPRITES + kind] = len(kind_things)
+            sprites.extend((thing.rect.x, thing.rect.y) for thing in kind_things)
+        if sprites:
+            self.sprites[:len(sprites)] = sprites
+
+        stars = game_state.stars[:STAR_CAPACITY]
+        header[STARS] = len(stars)
+        if stars:
+            self.stars[:len(stars)] = [(star.x - star.radius, star.y - star.radius, star.radius) for star in stars]
+            self.star_colors[:len(stars)] = [star.color for star in stars]
+
+        explosions = game_state.explosions[:EXPLOSION_CAPACITY]
+        header[EXPLOSIONS] = len(explosions)
+        if explosions:
+            self.explosions[:len(explosions)] = [(explosion.x, explosion.y, explosion.current_radius)
+                                                 for explosion in explosions]
+            self.explosion_colors[:len(explosions)] = [explosion.color for explosion in explosions]
+
+        header[PROJECTILES] = 0
+        if game_state.projectiles:
+            xs, ys = game_state.projectiles.positions()
+            header[PROJECTILES] = len(xs)
+            self.projectiles[0, :len(xs)] = xs
+            self.projectiles[1, :len(ys)] = ys
+
+        header[PARTICLES] = 0
+        header[PALETTE] = 0
+        if game_state.particles:
+            frame = game_state.particles.frame()
+            palette = frame.palette[:PALETTE_CAPACITY]
+            count = len(frame.x)
+            header[PARTICLES] = count
+            header[PALETTE] = len(palette)
+            self.particles[0, :count] = frame.x
+            self.particles[1, :count] = frame.y
+            self.particle_colors[:count] = frame.color
+            if palette:
+                self.palette[:len(palette)] = palette
+
+        header[SEQUENCE] = header[SEQUENCE] + 1
+
+    def sprite_runs(self):
+        # (name, xs, ys) for each kind of sprite, as views of the arrays.
+        start = 0
+        for kind, name in enumerate(SPRITE_NAMES):
+            end = start + int(self.header[SPRITES + kind])
+            yield name, self.sprites[start:end, 0], self.sprites[start:end, 1]
+            start = end
+
+
+class SharedFrame:
+    def __init__(self, projectile_capacity, particle_capacity, name=None):
+        fields = slot_fields(projectile_capacity, particle_capacity)
+        self.capacities = (projectile_capacity, particle_capacity)
+        size = CONTROL_SIZE * 8 + 2 * (slot_size(fields) + 8)
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        buffer = self.memory.buf
+        self.control = numpy.ndarray((CONTROL_SIZE,), numpy.int64, buffer, 0)
+        self.slots = []
+        offset = CONTROL_SIZE * 8
+        for i in range(2):
+            slot = FrameSlot(buffer, offset, fields)
+            self.slots.append(slot)
+            offset = slot.end
+
+    def publish(self, game_state, tick):
+        newest = int(self.control[NEWEST_SLOT])
+        writing = 1 - newest
+        self.slots[writing].write(game_state, tick)
+        self.control[NEWEST_SLOT] = writing
+
+    def newest(self, give_up_seconds=WRITE_SECONDS):
+        # The newest slot that is not being written, and its sequence number
+        # for still_valid. If the writer stopped halfway through a slot, as
+        # when the simulation process dies, it is (None, None).
+        give_up = time.perf_counter() + give_up_seconds
+        while True:
+            slot = self.slots[int(self.control[NEWEST_SLOT])]
+            sequence = int(slot.header[SEQUENCE])
+            if sequence % 2 == 0:
+                return slot, sequence
+            if time.perf_counter() > give_up:
+                return None, None
+
+    def still_valid(self, slot, sequence):
+        return int(slot.header[SEQUENCE]) == sequence
+
+    def close(self):
+        # The arrays point into the shared memory, so they must go first.
+        self.control = None
+        self.slots = []
+        self.memory.close()
+
+
+class RemoteInput(buttons.Buttons):
+    # What the simulation process has instead of PlayerInput: the same
+    # buttons, set from the entries the drawing process sends.
+    def __init__(self, entries):
+        super().__init__()
+        self.entries = entries
+
+    def receive(self):
+        while self.entries.poll():
+            self.buffer.extend(self.entries.recv())
+
+
+class SimulationProcess:
+    def __init__(self, game_state, projectile_capacity, particle_capacity, paced=True):
+        self.frame = SharedFrame(projectile_capacity, particle_capacity)
+        self.frame.publish(game_state, 0)
+        self.frame.control[QUALITY_LEVEL] = game_state.graphics.quality.level
+        receiver, self.entries = multiprocessing.Pipe(duplex=False)
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=run_simulation, daemon=True,
+            args=(self.frame.memory.name, self.frame.capacities,
+                  pickle.dumps(game_state, pickle.HIGHEST_PROTOCOL), receiver, paced))
+        self.process.start()
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def send_input(self, buffer):
+        # Once the simulation process has died there is no one to send to,
+        # which alive tells the drawing loop.
+        if buffer:
+            try:
+                self.entries.send(list(buffer))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            buffer.clear()
+
+    def set_quality_level(self, level):
+        self.frame.control[QUALITY_LEVEL] = level
+
+    def set_unfocused(self, unfocused):
+        self.frame.control[UNFOCUSED] = unfocused
+
+    def cpu_seconds(self):
+        return self.frame.control[CPU_MICROSECONDS] / 1000000
+
+    def stop(self):
+        self.frame.control[STOP] = 1
+        # Wakes the simulation if it is asleep on an idle screen.
+        try:
+            self.entries.send([])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.frame.close()
+        self.frame.memory.unlink()
+
+
+def run_simulation(memory_name, capacities, state_data, entries, paced):
+    # The simulation process. It has no window, only the images the game
+    # state needs for its rects and masks.
+    import logging
+    import pygame
+    import final
+    import gccontrol
+    import pacing
+    import replay
+    import sounds
+
+    logging.basicConfig(level=logging.INFO)
+    sounds.pre_init()
+    pygame.init()
+    graphics = final.Graphics(1.0)
+    sound_player = None
+    if final.SOUND and paced:
+        sound_player = sounds.make_sound_player(graphics.assets)
+    game_state = replay.StateUnpickler(io.BytesIO(state_data)).load()
+    game_state.graphics = graphics
+    frame = SharedFrame(*capacities, name=memory_name)
+    remote_input = RemoteInput(entries)
+    replay_writer = None
+    if final.REPLAY_FILE:
+        replay_writer = replay.ReplayWriter(final.REPLAY_FILE)
+
+    collector = gccontrol.Collector(final.GC_CONTROL)
+    tick_seconds = 1.0 / final.FRAMES_PER_SECOND
+    pacer = pacing.FramePacer(final.FRAMES_PER_SECOND, collector=collector)
+    tick = 0
+    # Starting up is not counted in the CPU time that is shared.
+    start_cpu_seconds = time.process_time()
+    while not frame.control[STOP]:
+        level = int(frame.control[QUALITY_LEVEL])
+        if level != graphics.quality.level:
+            graphics.quality.apply(level, final.QUALITY_LEVELS[level])
+        remote_input.receive()
+        remote_input.apply_until(time.perf_counter())
+        if replay_writer:
+            replay_writer.record(game_state, remote_input, tick_seconds)
+        game_state = final.step_game(game_state, remote_input, graphics, tick_seconds)
+        final.play_sounds(sound_player, game_state)
+        tick = tick + 1
+        frame.publish(game_state, tick)
+        frame.control[CPU_MICROSECONDS] = int((time.process_time() - start_cpu_seconds) * 1000000)
+        if paced:
+            collector.frame_done(game_state.mode, pacer.spare_seconds())
+            # Asleep on an idle screen, it wakes when input is sent.
+            tick_seconds = final.throttle_simulation(game_state, pacer,
+                                                     bool(frame.control[UNFOCUSED]),
+                                                     entries.poll)
+    if replay_writer:
+        replay_writer.close()
+    if paced:
+        logging.info(pacer.report("Simulation ticks"))
+    logging.info(collector.report())
+    if sound_player:
+        logging.info(sound_player.report())
+    collector.close()
+    frame.close()
+    pygame.quit()
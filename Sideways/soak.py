@@ -0,0 +1,250 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Plays the game headless for a long time with fuzzed input and watches
+# for leaks. Run with "python soak.py [minutes] [seed]". Random key presses
+# and releases go through PlayerInput, so the player dies, the game restarts
+# and new waves start over and over. Every game minute it samples the
+# resident memory, the number of live objects of each type and the frame
+# times, and at the end it prints a summary that flags anything that kept
+# growing or got slower.
+
+import gc
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import final
+import latency
+
+SAMPLE_TICKS = 60 * final.FRAMES_PER_SECOND
+WARMUP_SAMPLES = 2
+KEY_EVENT_CHANCE = 0.1
+PAUSE_CHANCE = 0.02
+AIM_SWITCH_CHANCE = 0.002
+RSS_ALLOWANCE = 1024 * 1024
+OBJECT_ALLOWANCE = 50
+SLOWDOWN_FRACTION = 1.25
+GAME_LISTS = ["player_shots", "alien_shots", "aliens", "stars", "explosions"]
+
+
+class FuzzedKeys:
+    # Makes random key events for the bound keys. Pause is rare, so the
+    # game is not paused most of the time. Now and then it aims at an alien
+    # for a while instead, or the waves would hardly ever be cleared.
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.keys = {}
+        for key, action in final.KEY_BINDINGS.items():
+            self.keys.setdefault(action, key)
+        self.actions = [action for action in self.keys if action != "pause"]
+        self.aiming = False
+
+    def events(self, game_state):
+        if self.random.random() < AIM_SWITCH_CHANCE:
+            self.aiming = not self.aiming
+        if self.aiming and game_state.aliens and game_state.player.alive:
+            return self.aim(game_state.player.rect, game_state.aliens[0].rect)
+        events = []
+        while self.random.random() < KEY_EVENT_CHANCE:
+            if self.random.random() < PAUSE_CHANCE:
+                action = "pause"
+            else:
+                action = self.random.choice(self.actions)
+            events.append(self.key_event(action, self.random.random() < 0.5))
+        return events
+
+    def aim(self, player_rect, alien_rect):
+        above = alien_rect.centery < player_rect.centery
+        fire = self.random.random() < 0.5
+        return [self.key_event("up", above), self.key_event("down", not above),
+                self.key_event("fire", fire)]
+
+    def key_event(self, action, pressed):
+        kind = pygame.KEYDOWN if pressed else pygame.KEYUP
+        return pygame.event.Event(kind, key=self.keys[action])
+
+
+def resident_bytes():
+    # The current resident set size where /proc has it, otherwise the
+    # largest it has been, which still shows growth.
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def object_counts():
+    # The samples themselves are left out, and they keep their numbers in
+    # tuples and dicts of numbers, which the collector does not track.
+    gc.collect()
+    counts = {}
+    for obj in gc.get_objects():
+        if isinstance(obj, Sample):
+            continue
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+class Sample:
+    def __init__(self, tick, game_state, frame_seconds):
+        self.tick = tick
+        self.rss = resident_bytes()
+        self.objects = object_counts()
+        self.lists = {name: len(getattr(game_state, name)) for name in GAME_LISTS}
+        frame_seconds = sorted(frame_seconds)
+        self.frame_ms = tuple(latency.percentile(frame_seconds, percent) * 1000
+                              for percent in latency.PERCENTILES)
+
+    def line(self):
+        return "Tick %8d: RSS %7.1f MiB, %7d objects, frames %s ms, %s" % (
+            self.tick, self.rss / (1024 * 1024), sum(self.objects.values()),
+            "/".join("%.2f" % ms for ms in self.frame_ms),
+            ", ".join("%s %d" % item for item in self.lists.items()))
+
+
+def kept_growing(values, allowance):
+    # True when the values after the warm up never went down and were
+    # still growing by more than the allowance in the second half. Memory
+    # that grows for a while and then levels off, like the heap settling,
+    # is not a leak.
+    values = values[WARMUP_SAMPLES:]
+    if len(values) < 3:
+        return False
+    never_fell = all(later >= earlier for earlier, later in zip(values, values[1:]))
+    return never_fell and values[-1] - values[len(values) // 2] > allowance
+
+
+def got_slower(samples):
+    # Compares the median frame time of the first and last third of the
+    # samples after the warm up.
+    medians = [sample.frame_ms[0] for sample in samples[WARMUP_SAMPLES:]]
+    third = len(medians) // 3
+    if third == 0:
+        return False
+    first = sorted(medians[:third])[third // 2]
+    last = sorted(medians[-third:])[third // 2]
+    return last > first * SLOWDOWN_FRACTION
+
+
+def print_summary(samples, counters, seconds):
+    print("Soak summary after %.0f seconds and %d ticks:" % (seconds, samples[-1].tick))
+    print("  Deaths %d, restarts %d, waves started %d, highest wave %d" % (
+        counters["deaths"], counters["restarts"], counters["waves"], counters["highest_wave"]))
+    first, last = samples[min(WARMUP_SAMPLES, len(samples) - 1)], samples[-1]
+    print("  RSS %.1f MiB after the warm up, %.1f MiB at the end" % (
+        first.rss / (1024 * 1024), last.rss / (1024 * 1024)))
+    print("  Frame time percentiles %s: %s ms at the start, %s ms at the end" % (
+        "/".join(str(percent) for percent in latency.PERCENTILES),
+        "/".join("%.2f" % ms for ms in samples[0].frame_ms),
+        "/".join("%.2f" % ms for ms in last.frame_ms)))
+
+    flags = []
+    if kept_growing([sample.rss for sample in samples], RSS_ALLOWANCE):
+        flags.append("RSS grew from %.1f MiB to %.1f MiB" % (
+            first.rss / (1024 * 1024), last.rss / (1024 * 1024)))
+    for name in sorted(last.objects):
+        counts = [sample.objects.get(name, 0) for sample in samples]
+        if kept_growing(counts, OBJECT_ALLOWANCE):
+            flags.append("%s objects grew from %d to %d" % (
+                name, counts[min(WARMUP_SAMPLES, len(counts) - 1)], counts[-1]))
+    for name in GAME_LISTS:
+        lengths = [sample.lists[name] for sample in samples]
+        if kept_growing(lengths, 0):
+            flags.append("GameState.%s grew from %d to %d" % (
+                name, lengths[min(WARMUP_SAMPLES, len(lengths) - 1)], lengths[-1]))
+    if got_slower(samples):
+        flags.append("Frames got slower, median %.2f ms at the start and %.2f ms at the end" % (
+            samples[WARMUP_SAMPLES].frame_ms[0], last.frame_ms[0]))
+    if len(samples) < WARMUP_SAMPLES + 3:
+        print("  Too few samples to look for growth, run for longer")
+    elif flags:
+        for flag in flags:
+            print("  GROWING: " + flag)
+    else:
+        print("  Nothing kept growing")
+    return not flags
+
+
+def main(minutes, seed):
+    pygame.init()
+    screen, graphics = final.open_screen((800, 600))
+    game_area = pygame.Rect(0, 0, 800, 560)
+    random.seed(seed)
+    fuzzed_keys = FuzzedKeys(seed)
+    player_input = final.PlayerInput()
+    game_state = final.GameState(graphics, game_area)
+    counters = {"deaths": 0, "restarts": 0, "waves": 0, "highest_wave": 0}
+    samples = []
+    frame_seconds = []
+    start = time.perf_counter()
+    end = start + minutes * 60
+    tick = 0
+    while True:
+        frame_start = time.perf_counter()
+        player_input.collect(fuzzed_keys.events(game_state))
+        player_input.apply_until(time.perf_counter())
+        was_alive = game_state.player.alive
+        wave_number = game_state.wave_number
+        old_game_state = game_state
+        game_state = final.step_game(game_state, player_input, graphics, 1 / final.FRAMES_PER_SECOND)
+        final.paint_screen(screen, game_state, graphics)
+        frame_seconds.append(time.perf_counter() - frame_start)
+
+        if game_state is not old_game_state:
+            counters["restarts"] = counters["restarts"] + 1
+        elif was_alive and not game_state.player.alive:
+            counters["deaths"] = counters["deaths"] + 1
+        elif game_state.wave_number != wave_number:
+            counters["waves"] = counters["waves"] + 1
+            counters["highest_wave"] = max(counters["highest_wave"], game_state.wave_number)
+
+        tick = tick + 1
+        if tick % SAMPLE_TICKS == 0:
+            samples.append(Sample(tick, game_state, frame_seconds))
+            print(samples[-1].line())
+            frame_seconds = []
+            if time.perf_counter() >= end:
+                break
+
+    passed = print_summary(samples, counters, time.perf_counter() - start)
+    pygame.quit()
+    return passed
+
+
+if __name__ == "__main__":
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    sys.exit(0 if main(minutes, seed) else 1)
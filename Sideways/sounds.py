@@ -0,0 +1,216 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Sound effects. There are no sound files, so each effect is made with NumPy
+# on the asset threads, once, as several copies at slightly different pitch
+# and volume. Playing one is then only a matter of handing a ready buffer to
+# a channel, with no mixing work at trigger time.
+#
+# A fixed pool of channels is shared by all the effects. When they are all
+# busy, the new sound takes over the channel that has been playing longest
+# among those with no higher priority, or is dropped if there is none. At
+# most TRIGGERS_PER_FRAME sounds start in one frame, so a whole wave blowing
+# up at once costs no more than a few.
+#
+# NumPy is optional. Without it, or without an audio device,
+# make_sound_player returns None and the game is silent.
+
+import itertools
+import math
+import time
+import pygame
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FREQUENCY = 22050
+BUFFER_SAMPLES = 512
+CHANNELS = 8
+VARIANTS = 4
+PITCH_SPREAD = 0.08
+VOLUME_SPREAD = 0.2
+TRIGGERS_PER_FRAME = 4
+# Higher numbers may take over the channels of lower ones.
+PRIORITIES = {
+    "fire": 0,
+    "alien_explosion": 1,
+    "wave_start": 2,
+    "player_death": 3,
+}
+
+
+def pre_init():
+    # Called before pygame.init, for a small buffer and so a short delay.
+    pygame.mixer.pre_init(FREQUENCY, -16, 1, BUFFER_SAMPLES)
+
+
+def make_sound_player(assets):
+    if numpy is None:
+        return None
+    if not pygame.mixer.get_init():
+        try:
+            pygame.mixer.init(FREQUENCY, -16, 1, BUFFER_SAMPLES)
+        except pygame.error:
+            return None
+    return SoundPlayer(assets)
+
+
+def envelope(samples, decay_seconds):
+    return numpy.exp(-numpy.arange(samples) / (decay_seconds * FREQUENCY))
+
+
+def tone(start_hertz, end_hertz, seconds):
+    samples = round(seconds * FREQUENCY)
+    hertz = numpy.linspace(start_hertz, end_hertz, samples)
+    return numpy.sin(numpy.cumsum(hertz) * (2 * math.pi / FREQUENCY))
+
+
+def noise(seconds, smoothing, seed):
+    # White noise averaged over smoothing samples, which takes the hiss off.
+    samples = round(seconds * FREQUENCY)
+    white = numpy.random.default_rng(seed).uniform(-1, 1, samples + smoothing)
+    summed = numpy.cumsum(white)
+    return (summed[smoothing:] - summed[:-smoothing]) / math.sqrt(smoothing)
+
+
+def make_fire():
+    wave = numpy.sign(tone(1200, 300, 0.12))
+    return 0.3 * wave * envelope(len(wave), 0.05)
+
+
+def make_alien_explosion():
+    wave = noise(0.5, 8, 1)
+    return 0.8 * wave * envelope(len(wave), 0.12)
+
+
+def make_player_death():
+    rumble = noise(1.2, 24, 2)
+    fall = tone(400, 60, 1.2)
+    return (0.7 * rumble + 0.3 * fall) * envelope(len(fall), 0.4)
+
+
+def make_wave_start():
+    notes = [tone(hertz, hertz, 0.08) for hertz in [440, 554, 659, 880]]
+    wave = numpy.concatenate(notes)
+    return 0.3 * wave * envelope(len(wave), 0.3)
+
+
+EFFECTS = {
+    "fire": make_fire,
+    "alien_explosion": make_alien_explosion,
+    "player_death": make_player_death,
+    "wave_start": make_wave_start,
+}
+
+
+def make_variants(make_effect, count):
+    # The effect resampled to a few pitches around the original and scaled
+    # to a few volumes, as 16 bit samples.
+    wave = make_effect()
+    variants = []
+    for index in range(count):
+        spread = index / (count - 1) * 2 - 1 if count > 1 else 0
+        pitch = 1 + PITCH_SPREAD * spread
+        volume = 1 - VOLUME_SPREAD * (index % 2)
+        positions = numpy.arange(0, len(wave) - 1, pitch)
+        resampled = numpy.interp(positions, numpy.arange(len(wave)), wave)
+        variants.append((numpy.clip(resampled * volume, -1, 1) * 32767).astype(numpy.int16))
+    return variants
+
+
+def make_sounds(variants):
+    # Done on the thread that plays them, once the mixer is set up.
+    channels = pygame.mixer.get_init()[2]
+    sounds = []
+    for samples in variants:
+        if channels > 1:
+            samples = numpy.repeat(samples[:, None], channels, axis=1)
+        sounds.append(pygame.mixer.Sound(buffer=samples.tobytes()))
+    return sounds
+
+
+class SoundPlayer:
+    def __init__(self, assets):
+        # The effects are optional assets. They start loading now, and the
+        # game is silent for any that are not in yet.
+        self.assets = assets
+        for name, make_effect in EFFECTS.items():
+            assets.load("sound_" + name, make_variants, make_effect, VARIANTS,
+                        required=False, finish=make_sounds)
+            assets.start("sound_" + name)
+        pygame.mixer.set_num_channels(CHANNELS)
+        self.channels = [pygame.mixer.Channel(index) for index in range(CHANNELS)]
+        self.started = [0.0] * CHANNELS
+        self.priorities = [0] * CHANNELS
+        self.next_variant = {name: itertools.cycle(range(VARIANTS)) for name in EFFECTS}
+        self.triggers = 0
+        self.played = 0
+        self.stolen = 0
+        self.dropped = 0
+
+    def play(self, name):
+        if self.triggers >= TRIGGERS_PER_FRAME:
+            self.dropped = self.dropped + 1
+            return
+        sounds = self.assets.get("sound_" + name)
+        if sounds is None:
+            return
+        priority = PRIORITIES[name]
+        index = self.free_channel(priority)
+        if index is None:
+            self.dropped = self.dropped + 1
+            return
+        channel = self.channels[index]
+        if channel.get_busy():
+            channel.stop()
+            self.stolen = self.stolen + 1
+        channel.play(sounds[next(self.next_variant[name])])
+        self.started[index] = time.perf_counter()
+        self.priorities[index] = priority
+        self.triggers = self.triggers + 1
+        self.played = self.played + 1
+
+    def free_channel(self, priority):
+        # A channel that is not playing, or else the one that has played
+        # longest among those with no higher priority than the new sound.
+        oldest = None
+        for index, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return index
+            if self.priorities[index] <= priority:
+                if oldest is None or self.started[index] < self.started[oldest]:
+                    oldest = index
+        return oldest
+
+    def play_all(self, names):
+        for name in names:
+            self.play(name)
+
+    def frame_done(self):
+        self.triggers = 0
+
+    def report(self):
+        return "Sounds: %d played, %d took over a busy channel, %d dropped" % (
+            self.played, self.stolen, self.dropped)
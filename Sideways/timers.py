@@ -0,0 +1,113 @@
+# MIT License
+# 
+# Copyright (c) 2018 Peter Allin
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import heapq
+
+
+class TimerQueue:
+    # Items wait in a heap ordered by when they are due, so finding the due
+    # ones only costs something for the items that are actually due.
+    def __init__(self):
+        self.heap = []
+        self.count = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, due, item):
+        # The count keeps items that are due at the same time in the order
+        # they were scheduled, and means the items are never compared.
+        heapq.heappush(self.heap, (due, self.count, item))
+        self.count = self.count + 1
+
+    def pop_due(self, now):
+        due_items = []
+        while self.heap and self.heap[0][0] <= now:
+            due, count, item = heapq.heappop(self.heap)
+            due_items.append((due, item))
+        return due_items
+
+    def clear(self):
+        self.heap = []
+
+
+class TimingWheel:
+    # Items due at a time, kept in a ring of buckets that each cover
+    # slot_seconds. pop_due only looks in the buckets whose time has come,
+    # so it costs something for the due items and the few that share their
+    # bucket, however many items are waiting. Items due more than a turn of
+    # the wheel ahead wait in their bucket for the later turn.
+    def __init__(self, slot_seconds, slot_count=1024):
+        self.slot_seconds = slot_seconds
+        self.slots = [[] for i in range(slot_count)]
+        self.current_tick = 0
+
+    def schedule(self, due, item):
+        tick = max(int(due / self.slot_seconds), self.current_tick)
+        self.slots[tick % len(self.slots)].append((tick, due, item))
+
+    def pop_due(self, now):
+        due_items = []
+        now_tick = int(now / self.slot_seconds)
+        while self.current_tick <= now_tick:
+            slot = self.slots[self.current_tick % len(self.slots)]
+            waiting = []
+            for tick, due, item in slot:
+                if tick == self.current_tick and due <= now:
+                    due_items.append((due, item))
+                else:
+                    waiting.append((tick, due, item))
+            slot[:] = waiting
+            if self.current_tick == now_tick:
+                break
+            self.current_tick = self.current_tick + 1
+        return due_items
+
+
+class GameClock:
+    # Game time only moves when the game is stepped, so it can be paused,
+    # slowed down or sped up, and a headless run never waits for real time
+    # to pass.
+    def __init__(self, scale=1.0):
+        self.seconds = 0.0
+        self.scale = scale
+        self.paused = False
+        self.timers = TimerQueue()
+
+    def tick(self, real_seconds):
+        if self.paused:
+            return 0.0
+        seconds = real_seconds * self.scale
+        self.seconds = self.seconds + seconds
+        for due, callback in self.timers.pop_due(self.seconds):
+            callback()
+        return seconds
+
+    def call_later(self, delay_seconds, callback):
+        self.timers.schedule(self.seconds + delay_seconds, callback)
+
+    def real_seconds_to_next_timer(self):
+        # None when there are no timers or time is not moving.
+        if not self.timers.heap or self.paused or self.scale <= 0:
+            return None
+        return max(0.0, (self.timers.heap[0][0] - self.seconds) / self.scale)